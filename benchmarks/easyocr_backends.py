@@ -0,0 +1,78 @@
+"""
+Compare the EasyOCR inference backends (torch, onnx, onnx-int8) on the driver's license
+path: per-image latency, peak RSS and field accuracy. Each backend runs in its own
+process so RSS is not shared. Run from the repository root:
+
+    python benchmarks/easyocr_backends.py <corpus_dir> [backend ...]
+
+<corpus_dir> holds license images and a labels.json mapping each file name to its
+expected fields, e.g. {"license_01.jpg": {"License_Number": "S7120710B", ...}}.
+"""
+import os
+import sys
+import json
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+PROBE = """
+import json, os, resource, statistics, sys, time
+import cv2
+from models.ocr_engine import OCRResult, get_easyocr_reader, readtext_batch
+from models.model import extract_drivers_license_data
+
+corpus_dir = sys.argv[1]
+with open(os.path.join(corpus_dir, 'labels.json')) as f:
+    labels = json.load(f)
+
+start = time.perf_counter()
+get_easyocr_reader()
+load_seconds = time.perf_counter() - start
+
+latencies, correct, total = [], 0, 0
+for file_name, expected in labels.items():
+    image = cv2.imread(os.path.join(corpus_dir, file_name))
+    start = time.perf_counter()
+    result = readtext_batch([image])[0]
+    latencies.append(time.perf_counter() - start)
+
+    fields = extract_drivers_license_data(OCRResult.from_easyocr(result))
+    for field, value in expected.items():
+        total += 1
+        correct += (fields.get(field) or '').replace(' ', '') == value.replace(' ', '')
+
+latencies.sort()
+print(json.dumps({
+    'load_seconds': load_seconds,
+    'p50_ms': statistics.median(latencies) * 1000,
+    'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'field_accuracy': correct / total if total else None,
+}))
+"""
+
+
+def run_backend(backend, corpus_dir):
+    env = dict(os.environ, EASYOCR_BACKEND=backend, OCR_BATCH_MAX_ITEMS='1')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, corpus_dir],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(corpus_dir, backends=BACKENDS):
+    print(f"{'backend':<10} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'accuracy':>9}")
+    for backend in backends:
+        result = run_backend(backend, os.path.abspath(corpus_dir))
+        accuracy = f"{result['field_accuracy']:.1%}" if result['field_accuracy'] is not None else 'n/a'
+        print(f"{backend:<10} {result['load_seconds']:>8.2f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['peak_rss_mb']:>8.0f} {accuracy:>9}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2:] or BACKENDS)
@@ -0,0 +1,76 @@
+"""
+Compare the enhancement profiles (fast, binarize, full) in front of Tesseract on the
+driver's license path: enhancement and OCR latency, pixels handed to Tesseract and field
+accuracy. Run from the repository root:
+
+    python benchmarks/enhancement_profiles.py <corpus_dir> [profile ...]
+
+<corpus_dir> is laid out as for easyocr_backends.py: license images plus a labels.json
+mapping each file name to its expected fields.
+"""
+import os
+import sys
+import json
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.image_processing import ENHANCEMENT_PROFILES
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_profile(profile, corpus_dir, labels):
+    import cv2
+    from models.image_processing import enhance_image
+    from models.ocr_engine import run_tesseract
+    from models.model import extract_drivers_license_data
+
+    enhance_times, ocr_times, pixels = [], [], []
+    correct = total = 0
+    for file_name, expected in labels.items():
+        image = cv2.imread(os.path.join(corpus_dir, file_name), cv2.IMREAD_GRAYSCALE)
+
+        start = time.perf_counter()
+        enhanced = enhance_image(image, profile=profile, reuse_buffers=True)  # As the OCR pipeline calls it
+        enhance_times.append(time.perf_counter() - start)
+        pixels.append(enhanced.size)
+
+        start = time.perf_counter()
+        result = run_tesseract(enhanced)
+        ocr_times.append(time.perf_counter() - start)
+
+        fields = extract_drivers_license_data(result)
+        for field, value in expected.items():
+            total += 1
+            correct += (fields.get(field) or '').replace(' ', '') == value.replace(' ', '')
+
+    return {
+        'enhance_p50_ms': statistics.median(enhance_times) * 1000,
+        'ocr_p50_ms': statistics.median(ocr_times) * 1000,
+        'ocr_p95_ms': percentile(ocr_times, 0.95) * 1000,
+        'megapixels': statistics.mean(pixels) / 1e6,
+        'field_accuracy': correct / total if total else None,
+    }
+
+
+def main(corpus_dir, profiles=ENHANCEMENT_PROFILES):
+    with open(os.path.join(corpus_dir, 'labels.json')) as f:
+        labels = json.load(f)
+
+    print(f"{'profile':<10} {'enh ms':>8} {'ocr p50':>8} {'ocr p95':>8} {'MP':>6} {'accuracy':>9}")
+    for profile in profiles:
+        result = run_profile(profile, corpus_dir, labels)
+        accuracy = f"{result['field_accuracy']:.1%}" if result['field_accuracy'] is not None else 'n/a'
+        print(f"{profile:<10} {result['enhance_p50_ms']:>8.1f} {result['ocr_p50_ms']:>8.1f} "
+              f"{result['ocr_p95_ms']:>8.1f} {result['megapixels']:>6.2f} {accuracy:>9}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2:] or ENHANCEMENT_PROFILES)
@@ -0,0 +1,105 @@
+"""
+Profile the memory of each document type's pipeline (process_identity_card,
+process_drivers_license, process_log_card) stage by stage: peak traced allocation, memory
+left allocated, RSS growth and the top allocation sites. Firestore and Monday.com are the
+in-memory fakes from replay.py. Documents are processed one at a time, so no other
+upload's allocations count towards a stage's peak. Run from the repository root:
+
+    python benchmarks/memory_profile.py --runs 3 --out memory_profile/
+    python benchmarks/memory_profile.py --baseline memory_profile/
+
+Uses the images given with --identity-card, --drivers-license and --log-card, or cards
+generated in a temporary directory when those are omitted. --out writes one
+<document_type>.json per type; --baseline compares the mean peak of every stage against
+such a directory and exits with status 1 if one grew by more than --tolerance.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Before numpy, OpenCV and the pipeline are imported, so their allocations are traced too
+from models import memory_profile
+memory_profile.enable(write_at_exit=False)
+
+from replay import DOCUMENT_TYPES, FakeFirestore, FakeMonday, install_fake_firestore, synthetic_card
+
+
+def run_documents(images, runs):
+    from models.model import process_identity_card, process_drivers_license, process_log_card
+    from models.firestore_writer import flush_firestore_writes
+
+    for run in range(runs):
+        identity_data = process_identity_card(images['identity_card'], user_id=200000 + run)
+        if not identity_data:
+            sys.exit(f"The identity card {images['identity_card']} could not be read.")
+
+        holder_key = identity_data['holder_key']
+        process_drivers_license(images['drivers_license'], holder_key)
+        process_log_card(images['log_card'], holder_key)
+    flush_firestore_writes()
+
+
+def find_regressions(report, baseline_dir, tolerance):
+    regressions = []
+    for document_type, stages in report.items():
+        path = os.path.join(baseline_dir, f"{document_type}.json")
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            baseline = json.load(f)['stages']
+
+        for key, stage in stages.items():
+            before = baseline.get(key, {}).get('peak_bytes_mean')
+            if before and stage['peak_bytes_mean'] > before * (1 + tolerance):
+                regressions.append(f"{document_type} {key}: peak {before / 1e6:.1f} MB -> "
+                                   f"{stage['peak_bytes_mean'] / 1e6:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=3, help="times each document is processed")
+    parser.add_argument('--identity-card', help="identity card image")
+    parser.add_argument('--drivers-license', help="driver's license image")
+    parser.add_argument('--log-card', help="log card image")
+    parser.add_argument('--out', help="directory to write the per-document-type reports to")
+    parser.add_argument('--baseline', help="directory of earlier reports to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed growth of a stage's mean peak")
+    args = parser.parse_args()
+
+    install_fake_firestore(FakeFirestore())
+    FakeMonday().install()
+
+    images = {
+        'identity_card': args.identity_card,
+        'drivers_license': args.drivers_license,
+        'log_card': args.log_card,
+    }
+    with tempfile.TemporaryDirectory(prefix='memory_profile_') as directory:
+        for document_type in DOCUMENT_TYPES:
+            images[document_type] = os.path.abspath(images[document_type]) if images[document_type] else synthetic_card(
+                document_type, os.path.join(directory, f"synthetic_{document_type}.png")
+            )
+
+        run_documents(images, args.runs)
+
+    report = memory_profile.memory_report()
+    print(memory_profile.format_report(report))
+    if args.out:
+        memory_profile.write_reports(args.out, name_format='{document_type}.json')
+
+    if args.baseline:
+        regressions = find_regressions(report, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
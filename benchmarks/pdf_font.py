@@ -0,0 +1,64 @@
+"""
+Compare two ways of starting a searchable PDF with the DejaVu font loaded: add_font() on a
+new FPDF, as new_utf8_pdf() does, against a deep copy of a template FPDF the font was
+added to once. Each is timed alone and through to a written page with some text on it.
+Run from the repository root:
+
+    python benchmarks/pdf_font.py [runs]
+"""
+import os
+import sys
+import copy
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.pdf_export import FONT_PATH
+
+
+def with_add_font():
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_font('DejaVu', '', FONT_PATH)
+    return pdf
+
+
+def template_copier():
+    from fpdf import FPDF
+
+    template = FPDF()
+    template.add_font('DejaVu', '', FONT_PATH)
+    return lambda: copy.deepcopy(template)
+
+
+def write_page(pdf):
+    pdf.add_page()
+    pdf.set_font('DejaVu', '', 12)
+    pdf.text(10, 20, 'Name TAN AH KOW  S1234567D  SBS3229P')
+    return bytes(pdf.output())
+
+
+def time_runs(function, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(runs=50):
+    copy_template = template_copier()
+    approaches = (('add_font', with_add_font), ('deepcopy', copy_template))
+
+    print(f"{'approach':<10} {'new ms':>8} {'page ms':>8}")
+    for name, new_pdf in approaches:
+        new_ms = time_runs(new_pdf, runs)
+        page_ms = time_runs(lambda: write_page(new_pdf()), runs)
+        print(f"{name:<10} {new_ms:>8.2f} {page_ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
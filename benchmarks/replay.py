@@ -0,0 +1,423 @@
+"""
+Replay Telegram conversations (/start, identity card, driver's license, log card) through
+the ConversationHandler built in main.py, offline: the bot, Firestore and the Monday.com
+endpoint are in-memory fakes, so only OCR and the handlers do real work. Reports per-step
+and end-to-end latency percentiles, throughput and resource usage. Run from the
+repository root:
+
+    python benchmarks/replay.py --users 50 --concurrency 8
+    python benchmarks/replay.py --updates recorded.jsonl --files recorded_files/
+
+Synthetic users upload the images given with --identity-card, --drivers-license and
+--log-card, or generated cards when those are omitted. A recording is a JSON-lines file
+of raw Telegram updates (as returned by getUpdates); their file_ids are resolved as file
+names inside --files.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# The fakes below only exist in this process, so OCR must not move to worker processes
+os.environ['OCR_WORKERS'] = '0'
+os.environ.setdefault('POLICY_BOARD_ID', '1')
+os.environ.setdefault('MONDAY_API_TOKEN', 'replay')
+os.environ.setdefault('HOLDER_KEY_SALT', 'replay')
+os.environ.setdefault('UPLOAD_BURST', '1000')  # Don't let the per-user rate limit skew the numbers
+
+from models.warm_up import DOCUMENT_TYPES, synthetic_card
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeQuery:
+    def __init__(self, store, path, filters=(), limit=None):
+        self._store = store
+        self._path = path
+        self._filters = filters
+        self._limit = limit
+
+    def where(self, field, op, value):
+        if op != '==':
+            raise NotImplementedError(f"FakeFirestore only supports '==' filters, not {op!r}")
+        return FakeQuery(self._store, self._path, self._filters + ((field, value),), self._limit)
+
+    def limit(self, count):
+        return FakeQuery(self._store, self._path, self._filters, count)
+
+    def get(self):
+        return self._store.query(self._path, self._filters, self._limit)
+
+    stream = get
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id=None):
+        return FakeDocument(self._store, f"{self._path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+
+class FakeDocument:
+    def __init__(self, store, path):
+        self._store = store
+        self._path = path
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._store, f"{self._path}/{name}")
+
+    def set(self, data, merge=False):
+        self._store.write(self._path, data, merge=merge)
+
+    def update(self, data):
+        self._store.write(self._path, data, merge=True)
+
+    def get(self):
+        return FakeSnapshot(self.id, self._store.read(self._path))
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+
+    def set(self, document, data, merge=False):
+        self._writes.append((document._path, data, merge))
+
+    def commit(self):
+        self._store.write_many(self._writes)
+
+
+class FakeFirestore:
+    """
+    Just enough of the Firestore client for the bot: documents, subcollections, batched
+    writes and equality queries, kept in a dict. Every call (or batch commit) sleeps
+    `latency` seconds to stand in for the network round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.documents = {}
+        self.operations = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def write(self, path, data, merge=False):
+        self.write_many([(path, data, merge)])
+
+    def write_many(self, writes):
+        self._round_trip()
+        with self._lock:
+            for path, data, merge in writes:
+                current = self.documents.get(path) if merge else None
+                self.documents[path] = {**(current or {}), **data}
+
+    def read(self, path):
+        self._round_trip()
+        with self._lock:
+            return self.documents.get(path)
+
+    def query(self, path, filters, limit):
+        self._round_trip()
+        with self._lock:
+            matches = [
+                FakeSnapshot(doc_path.rsplit('/', 1)[-1], data)
+                for doc_path, data in self.documents.items()
+                if doc_path.rsplit('/', 1)[0] == path and all(data.get(field) == value for field, value in filters)
+            ]
+        return matches[:limit] if limit else matches
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeMonday:
+    """
+    Replaces requests.post for api.monday.com: records the mutation and answers 200 after
+    `latency` seconds. Requests to any other host go through unchanged.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.items = []
+        self._lock = threading.Lock()
+        self._post = None
+
+    def install(self):
+        import requests
+
+        self._post = requests.post
+        requests.post = self.post
+
+    def post(self, url, *args, **kwargs):
+        if not url.startswith('https://api.monday.com'):
+            return self._post(url, *args, **kwargs)
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.items.append(kwargs.get('json'))
+            item_id = len(self.items)
+        return FakeResponse(200, {'data': {'create_item': {'id': str(item_id)}}})
+
+
+def install_fake_firestore(db):
+    """
+    Point database.firebase_init.initialize_firestore at `db`. The module holds the real
+    credentials and is not part of the repository, so a stand-in is registered if it is
+    missing.
+    """
+    import types
+
+    try:
+        import database.firebase_init as firebase_init
+    except ImportError:
+        sys.modules.setdefault('database', types.ModuleType('database'))
+        firebase_init = sys.modules['database.firebase_init'] = types.ModuleType('database.firebase_init')
+        sys.modules['database'].firebase_init = firebase_init
+
+    firebase_init.initialize_firestore = lambda: db
+
+
+def make_replay_bot(files_dir):
+    """
+    A bot that never talks to Telegram: replies are counted, and get_file() serves the
+    file named by the file_id from `files_dir` (or the file_id itself if it is a path).
+    """
+    from telegram import Chat, File, Message, User
+    from telegram.ext import ExtBot
+
+    class ReplayBot(ExtBot):
+        def __init__(self):
+            super().__init__(token='0:replay')
+            self._bot_user = User(id=0, first_name='Replay', is_bot=True, username='replay_bot')
+            self.replies = defaultdict(list)
+
+        async def get_me(self, *args, **kwargs):
+            return self._bot_user
+
+        async def send_message(self, chat_id, text, *args, **kwargs):
+            self.replies[chat_id].append(text)
+            return Message(message_id=len(self.replies[chat_id]), date=datetime.now(timezone.utc), text=text,
+                           chat=Chat(id=chat_id, type=Chat.PRIVATE), from_user=self._bot_user)
+
+        async def get_file(self, file_id, *args, **kwargs):
+            path = os.path.join(files_dir, file_id) if files_dir else file_id
+            file = File(file_id=file_id, file_unique_id=file_id, file_path=os.path.abspath(path))
+            file.set_bot(self)
+            return file
+
+    return ReplayBot()
+
+
+def upload_message(user_id, message_id, path):
+    message = {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f"Replay {user_id}"},
+    }
+    if path.lower().endswith(('.jpg', '.jpeg')):
+        message['photo'] = [{'file_id': path, 'file_unique_id': f"{user_id}-{message_id}", 'width': 1200, 'height': 800}]
+    else:
+        message['document'] = {'file_id': path, 'file_unique_id': f"{user_id}-{message_id}", 'file_name': os.path.basename(path)}
+    return message
+
+
+def synthetic_conversations(users, images):
+    """
+    One conversation per user: /start, then each document in order.
+    """
+    conversations = []
+    update_id = 0
+    for i in range(users):
+        user_id = 100000 + i
+        start = {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"Replay {user_id}"},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        }
+        messages = [start] + [upload_message(user_id, n + 2, images[document_type])
+                              for n, document_type in enumerate(DOCUMENT_TYPES)]
+
+        updates = []
+        for message in messages:
+            update_id += 1
+            updates.append({'update_id': update_id, 'message': message})
+        conversations.append(updates)
+    return conversations
+
+
+def recorded_conversations(updates_path):
+    """
+    Group a recording's updates into one conversation per sender, keeping their order.
+    """
+    by_user = defaultdict(list)
+    with open(updates_path) as f:
+        for line in f:
+            if line.strip():
+                update = json.loads(line)
+                if 'message' in update:  # Only messages reach the conversation's handlers
+                    by_user[update['message']['from']['id']].append(update)
+    return list(by_user.values())
+
+
+def step_name(update):
+    message = update['message']
+    if message.get('text', '').startswith('/'):
+        return message['text'].split()[0]
+    return 'upload' if 'photo' in message or 'document' in message else 'text'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+async def replay(app, conversations, concurrency):
+    from telegram import Update
+    from controllers.bot_controller import wait_for_uploads
+
+    step_latencies = defaultdict(list)
+    conversation_latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_conversation(updates):
+        async with semaphore:
+            start = time.perf_counter()
+            for data in updates:
+                update = Update.de_json(data, app.bot)
+                step_start = time.perf_counter()
+                await app.process_update(update)
+                await wait_for_uploads(data['message']['from']['id'])  # Uploads run past their update
+                step_latencies[step_name(data)].append(time.perf_counter() - step_start)
+            conversation_latencies.append(time.perf_counter() - start)
+
+    async with app:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_conversation(updates) for updates in conversations))
+        elapsed = time.perf_counter() - start
+
+    return step_latencies, conversation_latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20, help="synthetic conversations to replay")
+    parser.add_argument('--concurrency', type=int, default=4, help="conversations in flight at once")
+    parser.add_argument('--updates', help="JSON-lines recording of Telegram updates to replay instead")
+    parser.add_argument('--files', help="directory holding the recording's files, named by file_id")
+    parser.add_argument('--identity-card', help="image for synthetic identity card uploads")
+    parser.add_argument('--drivers-license', help="image for synthetic driver's license uploads")
+    parser.add_argument('--log-card', help="image for synthetic log card uploads")
+    parser.add_argument('--firestore-latency-ms', type=float, default=20, help="fake Firestore round trip")
+    parser.add_argument('--monday-latency-ms', type=float, default=150, help="fake Monday.com round trip")
+    parser.add_argument('--cold', action='store_true', help="skip the warm-up, so the first uploads pay the cold start")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='replay-'))  # Keep the uploads the handlers save out of the repository
+    logging.basicConfig(level=logging.WARNING)
+
+    db = FakeFirestore(latency=args.firestore_latency_ms / 1000)
+    monday = FakeMonday(latency=args.monday_latency_ms / 1000)
+    install_fake_firestore(db)
+    monday.install()
+
+    if args.updates:
+        conversations = recorded_conversations(args.updates)
+        files_dir = args.files
+    else:
+        images = {
+            'identity_card': args.identity_card,
+            'drivers_license': args.drivers_license,
+            'log_card': args.log_card,
+        }
+        for document_type, path in images.items():
+            images[document_type] = os.path.abspath(path) if path else synthetic_card(
+                document_type, os.path.abspath(f"synthetic_{document_type}.png")
+            )
+        conversations = synthetic_conversations(args.users, images)
+        files_dir = None
+
+    from main import build_application
+
+    # The application's logging setup is for the live bot; keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bot = make_replay_bot(files_dir)
+    app = build_application(bot=bot)
+
+    from models.firestore_writer import flush_firestore_writes
+
+    if not args.cold:
+        from models.ocr_workers import warm_up_workers
+        warm_up_workers()
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    step_latencies, conversation_latencies, elapsed = asyncio.run(replay(app, conversations, args.concurrency))
+    flush_firestore_writes()  # Writes are behind the replies; count them all
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    updates = sum(len(updates) for updates in conversations)
+    cpu_seconds = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    print(f"{len(conversations)} conversations, {updates} updates, concurrency {args.concurrency}, {elapsed:.2f}s")
+    print(f"throughput: {len(conversations) / elapsed:.2f} conversations/s, {updates / elapsed:.2f} updates/s")
+    print(f"{'step':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, latencies in sorted(step_latencies.items()) + [('conversation', conversation_latencies)]:
+        print(f"{name:<14} {len(latencies):>6} {percentile(latencies, 0.5) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>9.1f} {percentile(latencies, 0.99) * 1000:>9.1f} "
+              f"{max(latencies) * 1000:>9.1f}")
+    print(f"CPU: {cpu_seconds:.1f}s ({cpu_seconds / elapsed:.0%} of one core), "
+          f"peak RSS: {usage_after.ru_maxrss / 1024:.0f} MB")
+    print(f"Firestore operations: {db.operations}, Monday.com items: {len(monday.items)}, "
+          f"bot replies: {sum(len(replies) for replies in bot.replies.values())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Measure bot cold start: how long `import main` takes in a fresh interpreter, which
+heavy libraries it pulls in, and how long the startup warm-up takes per component.
+Run from the repository root:
+
+    python benchmarks/startup_time.py [runs]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that should only be loaded once a document is actually processed
+HEAVY_MODULES = ('torch', 'easyocr', 'cv2', 'pytesseract', 'fpdf', 'fitz', 'flask', 'firebase_admin', 'requests')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+warm_up_seconds = None
+if {warm_up!r}:
+    from models.warm_up import warm_up
+    warm_up_seconds = warm_up()
+print(json.dumps({{'import_seconds': import_seconds, 'loaded': loaded, 'warm_up_seconds': warm_up_seconds}}))
+"""
+
+
+def run_probe(warm_up=False):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES, warm_up=warm_up)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    results = [run_probe() for _ in range(runs)]
+    import_times = [result['import_seconds'] for result in results]
+
+    print(f"import main: median {statistics.median(import_times) * 1000:.1f} ms, "
+          f"max {max(import_times) * 1000:.1f} ms over {runs} runs")
+    print(f"heavy modules loaded at import: {results[0]['loaded'] or 'none'}")
+
+    warm_up = run_probe(warm_up=True)
+    for component, seconds in warm_up['warm_up_seconds'].items():
+        print(f"warm-up {component}: {seconds * 1000:.1f} ms")
+    print(f"warm-up total: {sum(warm_up['warm_up_seconds'].values()) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -1,8 +1,16 @@
 import io
+import asyncio
 import logging
+from collections import defaultdict
 from telegram import Update
-from telegram.ext import CallbackContext, ConversationHandler
-from models.model import process_uploaded_document, process_identity_card, fetch_sanitized_name_from_firestore, send_data_to_monday
+from telegram.ext import CallbackContext
+from models.model import fetch_holder_from_firestore
+from models.ocr_workers import OCR_WORKERS, process_document, new_cancel_token
+from models.documents import SUPPORTED_EXTENSIONS
+from controllers.upload_scheduler import FairUploadScheduler, UploadSuperseded
+from controllers.concurrency_controller import OCR_MAX_CONCURRENCY, ConcurrencyController
+from models.metrics import register_metrics
+from models.tracing import span, current_context
 from views.telegram_view import create_upload_button
 import os
 
@@ -10,9 +18,25 @@ logger = logging.getLogger(__name__)
 
 CHOOSING, UPLOADING = range(2)
 
+# Per-user upload limits and fair turns on the OCR workers, shared by every chat
+upload_scheduler = FairUploadScheduler(token_factory=new_cancel_token)
+
+# Resizes the scheduler against the target p95; with worker processes, more uploads than
+# workers would only queue inside the workers
+concurrency_controller = ConcurrencyController(
+    upload_scheduler, max_concurrency=OCR_MAX_CONCURRENCY or (OCR_WORKERS if OCR_WORKERS > 0 else 0)
+)
+upload_scheduler.latency_observer = concurrency_controller.observe
+register_metrics('ocr_concurrency', concurrency_controller.metrics)
+
+# Upload tasks not finished yet, per user, and the update ID of each user's newest upload
+# of each document type
+_running_uploads = defaultdict(set)
+_latest_uploads = {}
+
 # Function to handle the initial greeting and ask the user to upload their ID card
 async def ask_name(update: Update, context: CallbackContext) -> int:
-    welcome_message = "Hello! Welcome to GoBingo Life. Please upload your Identity Card as an image (JPEG or PNG format)."
+    welcome_message = "Hello! Welcome to GoBingo Life. Please upload your Identity Card as an image (JPEG, PNG or TIFF) or a PDF."
     reply_markup = create_upload_button("Upload Policy holder's Identity Card")
     await update.message.reply_text(welcome_message, reply_markup=reply_markup)
     
@@ -37,35 +61,81 @@ async def handle_upload_button_press(update: Update, context: CallbackContext) -
     return UPLOADING
 
 async def handle_image(update: Update, context: CallbackContext) -> int:
+    # Updates are ordered per user (see PerUserUpdateProcessor), so only the conversation's
+    # state is read here. The upload itself runs as a task of its own: a newer upload from
+    # the same user then reaches the scheduler while this one is still queued or running,
+    # and supersedes it
+    user_id = str(update.message.from_user.id)
+    document_type = context.user_data.get('document_type', 'identity_card')
+    holder_key = context.user_data.get('holder_key') if document_type != 'identity_card' else None
+    _latest_uploads[(user_id, document_type)] = update.update_id
+
+    task = context.application.create_task(_process_upload(update, context, user_id, document_type, holder_key),
+                                           update=update)
+    tasks = _running_uploads[user_id]
+    tasks.add(task)
+    task.add_done_callback(lambda task: _forget_upload(user_id, document_type, update.update_id, task))
+    return UPLOADING
+
+def _forget_upload(user_id, document_type, update_id, task):
+    tasks = _running_uploads.get(user_id)
+    if tasks is not None:
+        tasks.discard(task)
+        if not tasks:
+            del _running_uploads[user_id]
+    if _latest_uploads.get((user_id, document_type)) == update_id:
+        del _latest_uploads[(user_id, document_type)]
+
+async def wait_for_uploads(user_id):
+    """
+    Wait until every upload the user has sent so far was processed (or superseded).
+    """
+    user_id = str(user_id)
+    while _running_uploads.get(user_id):
+        await asyncio.gather(*_running_uploads[user_id], return_exceptions=True)
+
+async def _process_upload(update, context, user_id, document_type, holder_key):
+    # One trace per upload; the OCR worker and Firestore/Monday calls add child spans to it
+    with span('telegram.update', update_id=update.update_id, user_id=user_id, document_type=document_type):
+        await _handle_image(update, context, user_id, document_type, holder_key)
+
+async def _handle_image(update: Update, context: CallbackContext, user_id, document_type, holder_key):
     try:
         # Check if the image was uploaded as a document or a photo
         if update.message.document:
             file = await update.message.document.get_file()
             file_name_ext = update.message.document.file_name.split('.')[-1].lower()
-            if file_name_ext not in ['jpg', 'jpeg', 'png']:
-                await update.message.reply_text("Please upload a valid image file (JPEG or PNG).")
-                return UPLOADING
+            if file_name_ext not in SUPPORTED_EXTENSIONS:
+                await update.message.reply_text("Please upload a valid image file (JPEG, PNG or TIFF) or a PDF.")
+                return
         elif update.message.photo:
             file = await update.message.photo[-1].get_file()
             file_name_ext = 'jpg'  # Default to jpg if uploaded as a photo
         else:
-            await update.message.reply_text("Please upload an image file (JPEG or PNG).")
-            return UPLOADING
+            await update.message.reply_text("Please upload an image file (JPEG, PNG or TIFF) or a PDF.")
+            return
+
+        if not upload_scheduler.admit(user_id):
+            await update.message.reply_text("Too many uploads, please wait a minute before sending another one.")
+            return
 
         # Notify the user that the system is processing the uploaded image
         await update.message.reply_text("Our system is currently processing your data, please wait and thank you!")
 
         # Download the file as bytes for further processing
-        file_bytes = await file.download_as_bytearray()
+        with span('download'):
+            file_bytes = await file.download_as_bytearray()
         file_like_object = io.BytesIO(file_bytes)
 
-        # Determine which document type is being uploaded
-        document_type = context.user_data.get('document_type', 'identity_card')
+        # A newer upload of the same document may have been downloaded first; it must not be
+        # superseded by this older one
+        if _latest_uploads.get((user_id, document_type)) != update.update_id:
+            raise UploadSuperseded()
 
         # Save the file to disk (could be used for logging or future analysis)
         image_folder = os.path.join(os.getcwd(), 'image_folder')
         os.makedirs(image_folder, exist_ok=True)
-        filename = f"{document_type}_{os.urandom(8).hex()}.jpg"
+        filename = f"{document_type}_{os.urandom(8).hex()}.{file_name_ext}"
         image_path = os.path.join(image_folder, filename)
 
         with open(image_path, "wb") as f:
@@ -73,13 +143,19 @@ async def handle_image(update: Update, context: CallbackContext) -> int:
 
         logger.info(f"Image saved to {image_path}")
 
+        # The job may run on another thread or process, so the trace is handed over explicitly
+        trace_context = current_context()
+
         # Process the uploaded document based on document type
         if document_type == 'identity_card':
-            extracted_data = process_identity_card(image_path, user_id=str(update.message.from_user.id))
+            extracted_data = await upload_scheduler.run(
+                user_id, document_type, lambda cancel_token: process_document('identity_card', image_path, user_id=user_id, cancel_token=cancel_token,
+                                                      trace_context=trace_context, threads=concurrency_controller.thread_budget())
+            )
 
             if extracted_data:
-                sanitized_name = extracted_data.get('sanitized_name')
-                context.user_data['sanitized_name'] = sanitized_name
+                context.user_data['holder_key'] = extracted_data.get('holder_key')
+                context.user_data['sanitized_name'] = extracted_data.get('sanitized_name')
                 context.user_data['identity_card_data'] = extracted_data  # Save data temporarily
 
                 # Prompt for driver's license upload
@@ -89,19 +165,20 @@ async def handle_image(update: Update, context: CallbackContext) -> int:
             else:
                 logger.error("Failed to process identity card.")
                 await update.message.reply_text("Failed to extract information from the Identity Card.")
-                return UPLOADING
 
         else:
-            sanitized_name = context.user_data.get('sanitized_name')
-            if not sanitized_name:
-                user_id = str(update.message.from_user.id)
-                sanitized_name = fetch_sanitized_name_from_firestore(user_id)
-                if not sanitized_name:
+            if not holder_key:
+                holder_key, _ = await asyncio.to_thread(fetch_holder_from_firestore, user_id)
+                if not holder_key:
                     await update.message.reply_text("Missing identity card data. Please upload the Identity Card first.")
-                    return UPLOADING
-
-            extracted_data = process_uploaded_document(image_path, document_type=document_type, sanitized_name=sanitized_name)
-
+                    return
+
+            extracted_data = await upload_scheduler.run(
+                user_id, document_type,
+                lambda cancel_token: process_document(document_type, image_path, user_id=user_id, holder_key=holder_key,
+                                                      cancel_token=cancel_token, trace_context=trace_context,
+                                                      threads=concurrency_controller.thread_budget())
+            )
             if extracted_data:
                 # Save data for each document temporarily
                 if document_type == 'drivers_license':
@@ -115,34 +192,26 @@ async def handle_image(update: Update, context: CallbackContext) -> int:
                 elif document_type == 'log_card':
                     context.user_data['log_card_data'] = extracted_data
 
-                    # Now, check if all three documents are uploaded
-                    if ('identity_card_data' in context.user_data and
-                            'drivers_license_data' in context.user_data and
-                            'log_card_data' in context.user_data):
-
-                        # Combine all data to send to Monday.com
-                        complete_data = {
-                            'identity_card': context.user_data['identity_card_data'],
-                            'drivers_license': context.user_data['drivers_license_data'],
-                            'log_card': context.user_data['log_card_data']
-                        }
-
-                        send_to_monday_result = send_data_to_monday(complete_data)
-                        if send_to_monday_result:
-                            await update.message.reply_text("All documents uploaded successfully and stored at BingoLife Co. Thank you!")
-                        else:
-                            await update.message.reply_text("Error occurred while sending data to Monday.com.")
+                    # The holder record in the model sends the merged data to Monday.com once all
+                    # three documents are in, and says whether that worked
+                    submitted = extracted_data.get('holder_submitted')
+                    if submitted:
+                        await update.message.reply_text("All documents uploaded successfully and stored at BingoLife Co. Thank you!")
+                    elif submitted is False:
+                        await update.message.reply_text("Your documents were read, but we could not submit them to BingoLife Co. "
+                                                        "right now. Please upload the Log Card again to retry.")
+                        logger.error("Completed holder record could not be submitted.")
                     else:
                         await update.message.reply_text("Failed to upload all documents.")
                         logger.error("All documents not uploaded.")
             else:
                 await update.message.reply_text("Failed to extract information from the uploaded document.")
                 logger.error("Extraction failed.")
-                return UPLOADING
 
-        return UPLOADING
+    except UploadSuperseded:
+        # A newer upload of the same document replaced this one before it finished
+        logger.info(f"Skipped a superseded {document_type} upload.")
 
     except Exception as e:
         logger.error(f"Error in handle_image: {e}")
         await update.message.reply_text("An error occurred while processing the image.")
-        return ConversationHandler.END
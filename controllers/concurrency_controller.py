@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+from collections import deque
+from models.concurrency import available_cores, OCR_THREADS_PER_JOB
+
+logger = logging.getLogger(__name__)
+
+# p95 of upload processing time (from leaving the queue to the extracted data) the
+# controller steers towards, in seconds
+OCR_TARGET_P95_SECONDS = float(os.getenv('OCR_TARGET_P95_SECONDS', '10'))
+
+# Bounds on the number of uploads OCR'd at once
+OCR_MIN_CONCURRENCY = int(os.getenv('OCR_MIN_CONCURRENCY', '1'))
+OCR_MAX_CONCURRENCY = int(os.getenv('OCR_MAX_CONCURRENCY', '0'))  # 0: twice the starting concurrency
+
+# Latencies the p95 is taken over (reset by every change), and completed uploads between two decisions
+LATENCY_WINDOW = 50
+ADJUST_EVERY = 10
+
+# Concurrency is only raised while the p95 is below this fraction of the target, the queue
+# isn't empty and the 1-minute load average is below the core count. It is only lowered
+# while the load average is at least the core count: a slow p95 on idle cores comes from
+# the documents themselves, and fewer slots would only add queueing
+RAISE_BELOW_FRACTION = 0.7
+
+# Decisions kept for the metrics
+DECISION_HISTORY = 20
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class ConcurrencyController:
+    """
+    Adjusts an upload scheduler's concurrency against a target p95 processing time,
+    additive-increase/multiplicative-decrease: when the p95 over the last uploads is above
+    the target and the cores are saturated, too many jobs are sharing them and a quarter
+    of the slots are taken away; when it is well below the target, uploads are waiting and
+    the CPU has headroom, one slot is added. Runs on the event loop, fed by the scheduler's
+    latency observer.
+    """
+
+    def __init__(self, scheduler, target_p95=OCR_TARGET_P95_SECONDS, min_concurrency=OCR_MIN_CONCURRENCY,
+                 max_concurrency=OCR_MAX_CONCURRENCY):
+        self.scheduler = scheduler
+        self.target_p95 = target_p95
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max_concurrency or 2 * scheduler.concurrency
+        self.cores = available_cores()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._since_decision = 0
+        self._decisions = deque(maxlen=DECISION_HISTORY)
+
+    def observe(self, seconds):
+        """
+        Record one completed upload's processing time, and resize the scheduler every
+        ADJUST_EVERY uploads.
+        """
+        self._latencies.append(seconds)
+        self._since_decision += 1
+        if self._since_decision >= ADJUST_EVERY:
+            self._since_decision = 0
+            self._adjust()
+
+    def _adjust(self):
+        p95 = percentile(self._latencies, 0.95)
+        load = os.getloadavg()[0] / self.cores if hasattr(os, 'getloadavg') else 0.0
+        current = self.scheduler.concurrency
+
+        if p95 > self.target_p95 and load >= 1.0 and current > self.min_concurrency:
+            concurrency, reason = max(self.min_concurrency, current - max(1, current // 4)), 'p95 over target, cores saturated'
+        elif (p95 < self.target_p95 * RAISE_BELOW_FRACTION and self.scheduler.queued and load < 1.0
+              and current < self.max_concurrency):
+            concurrency, reason = current + 1, 'uploads waiting, CPU headroom'
+        else:
+            return
+
+        self._decisions.append({
+            'time': time.time(), 'from': current, 'to': concurrency, 'reason': reason,
+            'p95_seconds': round(p95, 3), 'load_per_core': round(load, 2),
+        })
+        logger.info(f"OCR concurrency {current} -> {concurrency} ({reason}: p95 {p95:.2f}s, "
+                    f"target {self.target_p95:.2f}s, load {load:.2f} per core).")
+        self.scheduler.set_concurrency(concurrency)
+        self._latencies.clear()  # Judge the new concurrency on its own uploads
+
+    def thread_budget(self):
+        """
+        Threads an upload starting now may spread its pages and enhancement tiles over: its
+        share of the cores with the uploads already running, so a job running alone gets them
+        all and a full scheduler gets one each.
+        """
+        return max(1, self.cores // max(1, self.scheduler.running))
+
+    def metrics(self):
+        return {
+            'concurrency': self.scheduler.concurrency,
+            'min_concurrency': self.min_concurrency,
+            'max_concurrency': self.max_concurrency,
+            'running': self.scheduler.running,
+            'queued': self.scheduler.queued,
+            'target_p95_seconds': self.target_p95,
+            'p95_seconds': percentile(self._latencies, 0.95) if self._latencies else None,
+            'cores': self.cores,
+            'threads_per_job': OCR_THREADS_PER_JOB,
+            'thread_budget': self.thread_budget(),
+            'decisions': list(self._decisions),
+        }
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Updates handled at the same time across all users. Updates waiting for the same user's
+# earlier one count towards it too
+MAX_CONCURRENT_UPDATES = 256
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Handles different users' updates concurrently but each user's one after the other, in
+    the order they arrived. The conversation handler keeps its state and the user's
+    user_data['document_type'] per user, and two of their updates in flight at once would
+    race on both. Only that state step is ordered: handle_image() hands the upload itself
+    to a task of its own and returns, so a user's next upload gets to the upload scheduler
+    (and can supersede the earlier one) without waiting for it. Fairness across users is
+    the upload scheduler's job, not this one's.
+    """
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # user or chat ID -> [lock, updates holding or waiting for it]
+
+    @staticmethod
+    def _key(update):
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return 'user', user.id
+        chat = getattr(update, 'effective_chat', None)
+        return ('chat', chat.id) if chat is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from models.cancellation import JobCancelled
+from models.concurrency import default_concurrency
+
+logger = logging.getLogger(__name__)
+
+# Uploads a user may send in a burst, and how fast their allowance refills
+UPLOAD_BURST = int(os.getenv('UPLOAD_BURST', '5'))
+UPLOADS_PER_MINUTE = float(os.getenv('UPLOADS_PER_MINUTE', '6'))
+
+# Uploads processed at the same time across all users, to start with (see ConcurrencyController);
+# defaults to filling the cores at OCR_THREADS_PER_JOB each, at most one per OCR worker
+OCR_CONCURRENCY = int(os.getenv('OCR_CONCURRENCY', '0')) or default_concurrency(int(os.getenv('OCR_WORKERS', '0')))
+
+# Idle buckets are forgotten once this many users are being tracked
+MAX_TRACKED_USERS = 10000
+
+
+class UploadSuperseded(Exception):
+    """
+    Raised to an upload once the same user sent a newer upload of the same document type:
+    either it was still queued, or it was running and stopped at its next stage boundary.
+    Only the newest one is processed to the end.
+    """
+
+
+class TokenBucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate  # Tokens per second
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class PendingUpload:
+    __slots__ = ('user_id', 'document_type', 'job', 'future', 'cancel_token')
+
+    def __init__(self, user_id, document_type, job, future):
+        self.user_id = user_id
+        self.document_type = document_type
+        self.job = job
+        self.future = future
+        self.cancel_token = None  # Created when the upload starts running
+
+
+class FairUploadScheduler:
+    """
+    Sits in front of the OCR executor. Each user's uploads are admitted through a token
+    bucket, queued per user, and started round-robin across users whenever one of the
+    `concurrency` slots frees up, so one noisy chat can't starve everyone else.
+
+    A newer upload of the same document type supersedes the user's older one: a queued
+    one is dropped, a running one has its cancel token set and stops at the job's next
+    stage boundary. `token_factory` creates the tokens (see new_cancel_token()).
+    `latency_observer`, if given, is called with the seconds each completed upload ran.
+    """
+
+    def __init__(self, concurrency=OCR_CONCURRENCY, burst=UPLOAD_BURST, per_minute=UPLOADS_PER_MINUTE,
+                 token_factory=threading.Event, latency_observer=None):
+        self.concurrency = concurrency
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.token_factory = token_factory
+        self.latency_observer = latency_observer
+        self._buckets = {}
+        self._queues = OrderedDict()  # user_id -> deque of PendingUpload, in round-robin order
+        self._in_flight = {}  # (user_id, document_type) -> running PendingUpload
+        self._running = 0
+
+    def admit(self, user_id):
+        """
+        Take one upload from the user's allowance. Returns False if they are over their limit.
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_USERS:
+                self._forget_idle_users(now)
+            bucket = self._buckets[user_id] = TokenBucket(self.burst, self.rate)
+
+        admitted = bucket.try_take(now)
+        if not admitted:
+            logger.info(f"User {user_id} is over the upload limit.")
+        return admitted
+
+    def _forget_idle_users(self, now):
+        for user_id, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity and user_id not in self._queues:
+                del self._buckets[user_id]
+
+    async def run(self, user_id, document_type, job):
+        """
+        Queue `job` for the user and return its result once it has had its turn. `job` is
+        a coroutine function called with the upload's cancel token. Raises UploadSuperseded
+        if a newer upload of the same document type replaced it.
+        """
+        running = self._in_flight.get((user_id, document_type))
+        if running is not None:
+            running.cancel_token.set()
+            logger.info(f"Cancelling running {document_type} upload of user {user_id}, superseded by a newer one.")
+
+        queue = self._queues.setdefault(user_id, deque())
+        for pending in [pending for pending in queue if pending.document_type == document_type]:
+            queue.remove(pending)
+            pending.future.set_exception(UploadSuperseded())
+            logger.info(f"Queued {document_type} upload of user {user_id} superseded by a newer one.")
+
+        upload = PendingUpload(user_id, document_type, job, asyncio.get_running_loop().create_future())
+        queue.append(upload)
+        self._dispatch()
+        return await upload.future
+
+    def set_concurrency(self, concurrency):
+        """
+        Resize the number of slots. Extra slots start queued uploads right away; when shrinking,
+        running uploads finish and the surplus slots are simply not refilled.
+        """
+        self.concurrency = max(1, concurrency)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._running < self.concurrency and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            del self._queues[user_id]
+            if not queue:
+                continue
+
+            upload = queue.popleft()
+            if queue:
+                self._queues[user_id] = queue  # Back of the rotation
+
+            upload.cancel_token = self.token_factory()
+            self._in_flight[(user_id, upload.document_type)] = upload
+            self._running += 1
+            asyncio.ensure_future(self._execute(upload))
+
+    async def _execute(self, upload):
+        start = time.monotonic()
+        try:
+            result = await upload.job(upload.cancel_token)
+        except JobCancelled as e:
+            logger.info(f"Superseded {upload.document_type} upload of user {upload.user_id} stopped after {e}.")
+            upload.future.set_exception(UploadSuperseded())
+        except Exception as e:
+            if not upload.future.done():
+                upload.future.set_exception(e)
+        else:
+            if not upload.future.done():
+                upload.future.set_result(result)
+            if self.latency_observer:
+                self.latency_observer(time.monotonic() - start)  # Cancelled uploads would flatter the numbers
+        finally:
+            key = (upload.user_id, upload.document_type)
+            if self._in_flight.get(key) is upload:
+                del self._in_flight[key]
+            self._running -= 1
+            self._dispatch()
+
+    @property
+    def queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running(self):
+        return self._running
@@ -1,12 +1,28 @@
 from dotenv import load_dotenv
+
+# Load environment variables from .env, before the modules below read their settings on import
+load_dotenv()
+
 import logging
 from telegram.ext import Application, CommandHandler, MessageHandler, ConversationHandler, filters
+from models.concurrency import pin_library_threads
+from models import memory_profile
+
+# Before anything below imports numpy/OpenCV/torch, which size their thread pools on load
+pin_library_threads()
+
+# Likewise, so the allocations made while importing them are traced too
+if memory_profile.profiling_requested():
+    memory_profile.enable()
+
 from controllers.bot_controller import ask_name, handle_image, handle_upload_button_press  # Import functions from bot_controller
+from controllers.update_processor import PerUserUpdateProcessor
+from models.ocr_workers import shutdown_workers, warm_up_workers
+from models.warm_up import mark_ready
+from models.metrics import serve_readiness
+from models.firestore_writer import flush_firestore_writes
 import os
 
-# Load environment variables from .env
-load_dotenv()
-
 # Configure logging to capture any errors or information
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,30 +30,69 @@ logger = logging.getLogger(__name__)
 # Fetch the Telegram bot token from the environment
 TOKEN = os.getenv('TELEGRAM_BOT_API')
 
+# Warm up the OCR path before polling, so the first uploads don't pay its cold start
+WARM_UP = os.getenv('WARM_UP', 'true').lower() == 'true'
+
 # Define conversation states
 CHOOSING, UPLOADING = range(2)
 
+def build_conversation_handler():
+    """
+    The bot's conversation: /start, then document uploads until all three are in.
+    """
+    return ConversationHandler(
+        entry_points=[CommandHandler('start', ask_name)],
+        states={
+            CHOOSING: [MessageHandler(filters.TEXT, handle_upload_button_press)],
+            UPLOADING: [MessageHandler(filters.PHOTO | filters.Document.ALL, handle_image)]
+        },
+        fallbacks=[]  # You can add fallbacks to handle errors or /cancel
+    )
+
+
+def build_application(token=TOKEN, bot=None):
+    """
+    Build the application with the conversation handler attached. `bot` replaces the
+    Telegram bot, e.g. with an offline fake for benchmarks/replay.py.
+    """
+    # Different users' updates are handled concurrently, each user's in order; the upload
+    # scheduler decides how many uploads reach the OCR workers at once
+    builder = Application.builder().concurrent_updates(PerUserUpdateProcessor())
+    builder = builder.bot(bot) if bot is not None else builder.token(token)
+    app = builder.build()
+
+    # Add the conversation handler
+    app.add_handler(build_conversation_handler())
+    return app
+
+
 # Main function to run the bot
 if __name__ == '__main__':
     if not TOKEN:
         logger.error("No Telegram bot token provided. Check your .env file.")
+    elif not os.getenv('HOLDER_KEY_SALT'):
+        logger.error("No HOLDER_KEY_SALT provided; holder keys would be unsalted hashes of ID numbers. Check your .env file.")
     else:
         # Build the application using the bot token
-        app = Application.builder().token(TOKEN).build()
+        app = build_application(TOKEN)
 
-        # Define conversation handler to manage user flow
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler('start', ask_name)],
-            states={
-                CHOOSING: [MessageHandler(filters.TEXT, handle_upload_button_press)],
-                UPLOADING: [MessageHandler(filters.PHOTO | filters.Document.ALL, handle_image)]
-            },
-            fallbacks=[]  # You can add fallbacks to handle errors or /cancel
-        )
-
-        # Add the conversation handler
-        app.add_handler(conv_handler)
+        # Readiness probes see 503 until the warm-up below is done
+        serve_readiness()
 
         # Start the bot's polling loop
         logger.info("Bot is starting...")
-        app.run_polling()
+        try:
+            if WARM_UP:
+                durations = warm_up_workers()
+                logger.info("OCR warm-up per component: " + ', '.join(
+                    f"{component} {seconds * 1000:.0f} ms" for component, seconds in durations.items()))
+                mark_ready(durations)
+            else:
+                mark_ready()
+
+            app.run_polling()
+        finally:
+            # Stop the OCR worker processes (if OCR_WORKERS > 0) together with the bot,
+            # then give queued Firestore writes a chance to go out (the rest stay spooled)
+            shutdown_workers()
+            flush_firestore_writes()
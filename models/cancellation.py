@@ -0,0 +1,41 @@
+import threading
+from contextlib import contextmanager
+
+# Cancel token of the job running on this thread
+_current = threading.local()
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job at a stage boundary once its cancel token is set. Derives from
+    BaseException, like asyncio.CancelledError, so the broad `except Exception` handlers
+    around the OCR and Firestore steps don't swallow it.
+    """
+
+
+@contextmanager
+def cancellable(token):
+    """
+    Make `token` (anything with is_set(), e.g. a threading.Event or a manager Event proxy)
+    the cancel token checked by raise_if_cancelled() on this thread.
+    """
+    previous = getattr(_current, 'token', None)
+    _current.token = token
+    try:
+        yield
+    finally:
+        _current.token = previous
+
+
+def current_token():
+    return getattr(_current, 'token', None)
+
+
+def raise_if_cancelled(stage, token=None):
+    """
+    Stop the job at a stage boundary if it was cancelled. `token` defaults to this
+    thread's; pass it explicitly from helper threads.
+    """
+    token = token if token is not None else current_token()
+    if token is not None and token.is_set():
+        raise JobCancelled(stage)
@@ -0,0 +1,79 @@
+import os
+import sys
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Threads each OCR job may use inside torch, OpenCV and OpenMP (Tesseract, BLAS). Left to
+# themselves every library starts one thread per core, so N concurrent uploads run N x cores
+# threads and mostly wait on each other. Concurrency comes from running more jobs instead
+OCR_THREADS_PER_JOB = int(os.getenv('OCR_THREADS_PER_JOB', '1'))
+
+# Environment variables the libraries read when they load. OMP_THREAD_LIMIT is the one
+# Tesseract honours; OPENCV_FOR_THREADS_NUM sizes OpenCV's pool whatever its threading backend
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OMP_THREAD_LIMIT', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'OPENCV_FOR_THREADS_NUM')
+
+# Thread budget of the job running on this thread (see job_threads())
+_current = threading.local()
+
+
+def available_cores():
+    """
+    Cores this process may run on, which in a container or under taskset can be fewer
+    than the machine has.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def pin_library_threads(threads=OCR_THREADS_PER_JOB):
+    """
+    Cap the threads torch, OpenCV and OpenMP start, per process. The environment is set for
+    libraries not loaded yet (and for the OCR worker processes and Tesseract runs started
+    from here); torch and OpenCV are also capped directly if already imported. Variables
+    set explicitly in the environment are left alone.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(threads)
+    return threads
+
+
+def default_concurrency(workers=0, threads_per_job=OCR_THREADS_PER_JOB):
+    """
+    Uploads to OCR at once when nothing has been measured yet: enough jobs to fill the cores
+    at `threads_per_job` each, and never more than `workers` processes if OCR runs in them.
+    """
+    concurrency = max(1, available_cores() // max(1, threads_per_job))
+    return min(concurrency, workers) if workers > 0 else concurrency
+
+
+@contextmanager
+def job_threads(threads):
+    """
+    Make `threads` the budget the job running on this thread spreads its pages and
+    enhancement tiles over (see current_job_threads()). None leaves the default.
+    """
+    previous = getattr(_current, 'threads', None)
+    _current.threads = threads
+    try:
+        yield
+    finally:
+        _current.threads = previous
+
+
+def current_job_threads():
+    """
+    Threads the job on this thread may use for its own parallel work: the budget the upload
+    scheduler gave it when it started, or every core for work started outside a job.
+    """
+    threads = getattr(_current, 'threads', None)
+    return max(1, threads) if threads else available_cores()
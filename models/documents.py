@@ -0,0 +1,67 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# File extensions accepted as uploads; PDF and TIFF may hold several pages
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png')
+MULTI_PAGE_EXTENSIONS = ('pdf', 'tif', 'tiff')
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS + MULTI_PAGE_EXTENSIONS
+
+# Resolution PDF pages are rendered at before OCR
+PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', '200'))
+
+# Upper bound on pages read from one upload
+MAX_DOCUMENT_PAGES = int(os.getenv('MAX_DOCUMENT_PAGES', '10'))
+
+
+def split_document_pages(file_path):
+    """
+    Return the list of page image paths for an upload. Plain images are returned as-is,
+    PDF pages are rendered at PDF_RENDER_DPI and TIFF frames are written out, each as
+    a PNG next to the upload; remove_page_files() deletes those once they are read.
+    """
+    base, extension = os.path.splitext(file_path)
+    extension = extension.lstrip('.').lower()
+
+    if extension not in MULTI_PAGE_EXTENSIONS:
+        return [file_path]
+
+    import cv2
+    import fitz  # PyMuPDF, for rasterizing PDF uploads
+
+    page_paths = []
+    if extension == 'pdf':
+        with fitz.open(file_path) as document:
+            for page_number, page in enumerate(document):
+                if page_number >= MAX_DOCUMENT_PAGES:
+                    logger.warning(f"{file_path} has more than {MAX_DOCUMENT_PAGES} pages, ignoring the rest.")
+                    break
+                page_path = f"{base}_page{page_number + 1}.png"
+                page.get_pixmap(dpi=PDF_RENDER_DPI).save(page_path)
+                page_paths.append(page_path)
+    else:
+        loaded, frames = cv2.imreadmulti(file_path)
+        if not loaded:
+            logger.error(f"Unable to read pages from {file_path}")
+            return []
+        for page_number, frame in enumerate(frames[:MAX_DOCUMENT_PAGES]):
+            page_path = f"{base}_page{page_number + 1}.png"
+            cv2.imwrite(page_path, frame)
+            page_paths.append(page_path)
+
+    logger.info(f"Split {file_path} into {len(page_paths)} page(s).")
+    return page_paths
+
+
+def remove_page_files(file_path, page_paths):
+    """
+    Delete the page images split_document_pages() wrote for an upload, leaving the upload.
+    """
+    for page_path in page_paths:
+        if page_path == file_path:
+            continue
+        try:
+            os.remove(page_path)
+        except OSError as e:
+            logger.warning(f"Could not remove page image {page_path}: {e}")
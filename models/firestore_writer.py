@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from collections import deque
+from models.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Writes waiting for Firestore are spooled here (one file each) until committed, so they
+# survive a restart. Files left behind by a writer that is gone are picked up by the next
+# writer that starts; a writer counts as gone once its lock file in `owners` is unlocked
+FIRESTORE_SPOOL_DIR = os.getenv('FIRESTORE_SPOOL_DIR', os.path.join(os.getcwd(), 'firestore_spool'))
+
+# Writes committed per Firestore batch (Firestore allows up to 500), and how long the writer
+# waits for more writes to join a batch
+FIRESTORE_BATCH_SIZE = int(os.getenv('FIRESTORE_BATCH_SIZE', '100'))
+FIRESTORE_BATCH_WINDOW_MS = float(os.getenv('FIRESTORE_BATCH_WINDOW_MS', '200'))
+
+# Retry backoff after a failed commit, doubling up to the maximum (seconds)
+FIRESTORE_RETRY_INITIAL = 0.5
+FIRESTORE_RETRY_MAX = 30.0
+
+# Stands in for firestore.SERVER_TIMESTAMP in spool files
+SERVER_TIMESTAMP_MARKER = {'__server_timestamp__': True}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class PendingWrite:
+    __slots__ = ('path', 'data', 'merge', 'spool_path')
+
+    def __init__(self, path, data, merge, spool_path):
+        self.path = path
+        self.data = data
+        self.merge = merge
+        self.spool_path = spool_path
+
+
+def new_document_id():
+    """
+    A Firestore-style random document ID, chosen before the write is queued so a retried
+    write lands on the same document instead of creating another one.
+    """
+    return uuid.uuid4().hex[:20]
+
+
+def _spool_name(timestamp_ns, owner):
+    # <time>-<owning writer>-<random>.json: sorts in write order, and names the writer responsible for it
+    return f"{timestamp_ns:020d}-{owner}-{uuid.uuid4().hex[:8]}.json"
+
+
+def _try_lock(path):
+    """
+    Open `path` and take an exclusive lock on it without waiting. Returns the open file,
+    or None if another process holds the lock. The lock goes with the process, however it
+    exits, so unlike a PID it can't be mistaken for a restarted process's (in a container
+    the bot often comes back as PID 1 again).
+    """
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _encode(data):
+    from firebase_admin import firestore
+
+    return {key: SERVER_TIMESTAMP_MARKER if value is firestore.SERVER_TIMESTAMP else value for key, value in data.items()}
+
+
+def _decode(data):
+    from firebase_admin import firestore
+
+    return {key: firestore.SERVER_TIMESTAMP if value == SERVER_TIMESTAMP_MARKER else value for key, value in data.items()}
+
+
+def _is_transient(error):
+    """
+    Whether a failed commit is worth retrying as-is: Firestore unavailable, overloaded or
+    timing out, or the network not being there. Anything else (a rejected write, a value
+    Firestore can't store, a bug) would fail the same way forever.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    try:
+        from google.api_core import exceptions
+        from google.auth.exceptions import TransportError
+    except ImportError:
+        return False
+
+    return isinstance(error, (
+        exceptions.ServiceUnavailable, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+        exceptions.TooManyRequests, exceptions.Aborted, exceptions.Unknown, TransportError,
+    ))
+
+
+class FirestoreWriteBehind:
+    """
+    Write-behind queue in front of Firestore. set() spools the write to disk and returns;
+    a background thread commits queued writes in batches, in the order they were made,
+    retrying with backoff while Firestore is unavailable. A spool file is removed once
+    its write is committed, and spool files found at start-up are queued again (those
+    a stopped writer was still writing are deleted, set() never returned for them).
+
+    Writes Firestore rejects outright are moved to the spool's `failed` directory.
+    """
+
+    def __init__(self, spool_dir=FIRESTORE_SPOOL_DIR, batch_size=FIRESTORE_BATCH_SIZE,
+                 window_ms=FIRESTORE_BATCH_WINDOW_MS):
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.window = window_ms / 1000
+        self._queue = deque()
+        self._in_flight = []
+        self._condition = threading.Condition()
+        self._db = None
+
+        # Held for the life of the process, to tell other writers this one's spool files are taken
+        self.owner = uuid.uuid4().hex[:12]
+        self._owners_dir = os.path.join(self.spool_dir, 'owners')
+        os.makedirs(self._owners_dir, exist_ok=True)
+        self._owner_lock = _try_lock(os.path.join(self._owners_dir, f"{self.owner}.lock"))
+
+        self._recover()
+
+        self._thread = threading.Thread(target=self._run, name='firestore-writer', daemon=True)
+        self._thread.start()
+
+    def set(self, path, data, merge=False):
+        """
+        Queue a set() of the document at `path` (e.g. 'policy_holders/<key>'). Returns once
+        the write is spooled; raises OSError if it could not be.
+        """
+        record = {'path': path, 'data': _encode(data), 'merge': merge}
+        spool_path = os.path.join(self.spool_dir, _spool_name(time.time_ns(), self.owner))
+
+        # Write-then-rename, so a crash never leaves a half-written spool file behind
+        temp_path = spool_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, spool_path)
+
+        with self._condition:
+            self._queue.append(PendingWrite(path, data, merge, spool_path))
+            self._condition.notify_all()
+
+    def add(self, collection_path, data):
+        """
+        Queue a new document in `collection_path` and return its ID.
+        """
+        document_id = new_document_id()
+        self.set(f"{collection_path}/{document_id}", data)
+        return document_id
+
+    def pending_document(self, path):
+        """
+        The document at `path` as this process's uncommitted writes will leave it, or None
+        if none are queued. Lets a read see writes that haven't reached Firestore yet.
+        """
+        with self._condition:
+            writes = [write for write in self._in_flight + list(self._queue) if write.path == path]
+
+        document = None
+        for write in writes:
+            document = {**(document or {}), **write.data} if write.merge else dict(write.data)
+        return document
+
+    def flush(self, timeout=None):
+        """
+        Wait until every write queued so far is committed (or set aside as failed).
+        Returns False if `timeout` ran out first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._in_flight, timeout)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queue) + len(self._in_flight)
+
+    def _recover(self):
+        owned = {}  # Owning writer -> its spool files
+        partial = {}  # Owning writer -> spool files it was still writing when it stopped
+        for name in sorted(os.listdir(self.spool_dir)):
+            spool_name = name[:-len('.tmp')] if name.endswith('.json.tmp') else name
+            if not spool_name.endswith('.json'):
+                continue
+            try:
+                timestamp, owner, _ = spool_name[:-len('.json')].split('-')
+                timestamp = int(timestamp)
+            except ValueError:
+                continue  # Not a spool file
+            if spool_name is name:
+                owned.setdefault(owner, []).append((timestamp, name))
+            else:
+                owned.setdefault(owner, [])
+                partial.setdefault(owner, []).append(name)
+        for name in os.listdir(self._owners_dir):
+            if name.endswith('.lock'):
+                owned.setdefault(name[:-len('.lock')], [])
+
+        recovered = removed = 0
+        for owner, files in owned.items():
+            if owner == self.owner:
+                continue
+            lock_path = os.path.join(self._owners_dir, f"{owner}.lock")
+            lock_file = _try_lock(lock_path)
+            if lock_file is None:
+                continue  # Still owned by a running writer
+
+            try:
+                for timestamp, name in files:
+                    if self._claim(timestamp, name):
+                        recovered += 1
+                # Half-written: set() never returned for them, so nobody was told they were queued
+                for name in partial.get(owner, ()):
+                    if self._remove_partial(name):
+                        removed += 1
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass  # Another writer cleaned up after the same owner first
+            finally:
+                lock_file.close()
+
+        if recovered:
+            logger.info(f"Recovered {recovered} spooled Firestore write(s) from {self.spool_dir}.")
+        if removed:
+            logger.info(f"Removed {removed} half-written spool file(s) from {self.spool_dir}.")
+
+    def _remove_partial(self, name):
+        try:
+            os.remove(os.path.join(self.spool_dir, name))
+        except FileNotFoundError:
+            return False  # Another writer cleaned up after the same owner first
+        return True
+
+    def _claim(self, timestamp, name):
+        # Claim the file by renaming it, so two writers starting together don't both replay it
+        claimed_path = os.path.join(self.spool_dir, _spool_name(timestamp, self.owner))
+        try:
+            os.rename(os.path.join(self.spool_dir, name), claimed_path)
+            with open(claimed_path) as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return False  # Another writer claimed it first
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping spooled Firestore write {name}: {e}")
+            return False
+
+        self._queue.append(PendingWrite(record['path'], _decode(record['data']), record['merge'], claimed_path))
+        return True
+
+    def _next_batch(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue)
+
+            # Give concurrent uploads a moment to join the batch
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    break
+
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._in_flight = batch
+            return batch
+
+    def _connect(self):
+        """
+        The Firestore client, connecting on first use and after a failed commit. Retried
+        with backoff until it succeeds: nothing can be committed without it, and the
+        writes stay spooled meanwhile.
+        """
+        delay = FIRESTORE_RETRY_INITIAL
+        while self._db is None:
+            try:
+                from database.firebase_init import initialize_firestore
+                self._db = initialize_firestore()
+            except Exception as e:
+                logger.error(f"Could not connect to Firestore, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, FIRESTORE_RETRY_MAX)
+        return self._db
+
+    def _commit(self, writes):
+        db = self._connect()
+        with span('firestore.commit', writes=len(writes)):
+            batch = db.batch()
+            for write in writes:
+                batch.set(db.document(write.path), write.data, merge=write.merge)
+            batch.commit()
+
+    def _settle(self, writes, failed=False):
+        for write in writes:
+            try:
+                if failed:
+                    failed_dir = os.path.join(self.spool_dir, 'failed')
+                    os.makedirs(failed_dir, exist_ok=True)
+                    os.replace(write.spool_path, os.path.join(failed_dir, os.path.basename(write.spool_path)))
+                else:
+                    os.remove(write.spool_path)
+            except OSError as e:
+                logger.warning(f"Could not clean up spooled Firestore write {write.spool_path}: {e}")
+
+    def _commit_with_retries(self, writes):
+        delay = FIRESTORE_RETRY_INITIAL
+        while True:
+            try:
+                self._commit(writes)
+                self._settle(writes)
+                logger.info(f"Committed {len(writes)} Firestore write(s).")
+                return
+            except Exception as e:
+                if not _is_transient(e):
+                    if len(writes) > 1:
+                        # Find the write Firestore rejects without holding back the others
+                        for write in writes:
+                            self._commit_with_retries([write])
+                        return
+                    logger.error(f"Firestore rejected the write to {writes[0].path}, moved to failed: {e}")
+                    self._settle(writes, failed=True)
+                    return
+
+                logger.warning(f"Firestore commit of {len(writes)} write(s) failed, retrying in {delay:.1f}s: {e}")
+                self._db = None
+                time.sleep(delay)
+                delay = min(delay * 2, FIRESTORE_RETRY_MAX)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            self._commit_with_retries(batch)
+            with self._condition:
+                self._in_flight = []
+                self._condition.notify_all()
+
+
+def get_firestore_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = FirestoreWriteBehind()
+    return _writer
+
+
+def flush_firestore_writes(timeout=30.0):
+    """
+    Give queued writes a chance to reach Firestore before the process exits. Whatever is
+    left stays in the spool for the next start.
+    """
+    if _writer is not None and not _writer.flush(timeout):
+        logger.warning(f"{len(_writer)} Firestore write(s) still queued at exit, left in {_writer.spool_dir}.")
+
+
+def pending_document(path):
+    """
+    This process's uncommitted version of a document, or None (see FirestoreWriteBehind).
+    """
+    return _writer.pending_document(path) if _writer is not None else None
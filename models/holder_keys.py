@@ -0,0 +1,50 @@
+import os
+import re
+import uuid
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+_warned_unsalted = False
+
+
+def holder_key_salt():
+    """
+    HOLDER_KEY_SALT, the secret mixed into every key so holder keys can't be brute-forced
+    back into ID numbers. Read on use rather than on import, so a value from .env counts
+    however early this module was imported.
+    """
+    global _warned_unsalted
+    salt = os.getenv('HOLDER_KEY_SALT', '')
+    if not salt and not _warned_unsalted:
+        _warned_unsalted = True
+        logger.error("HOLDER_KEY_SALT is not set: holder keys are plain hashes of ID numbers.")
+    return salt
+
+
+def normalize_id_number(id_number):
+    """
+    Upper-case an ID number and strip everything but letters and digits, or return None
+    if nothing usable is left.
+    """
+    if not id_number:
+        return None
+    normalized = re.sub(r'[^A-Z0-9]', '', str(id_number).upper())
+    if not normalized or normalized == 'UNKNOWN':
+        return None
+    return normalized
+
+
+def holder_key_for(id_number):
+    """
+    Firestore document ID of a policy holder: a salted SHA-256 of their normalized ID
+    number. Two people with the same name never collide, the same card always maps to
+    the same holder, and keys spread evenly over the key range instead of clustering.
+    A holder whose ID number couldn't be read gets a random key of the same shape
+    rather than sharing an "unknown" document with everyone else.
+    """
+    normalized = normalize_id_number(id_number)
+    if normalized is None:
+        return uuid.uuid4().hex
+    return hashlib.sha256((holder_key_salt() + normalized).encode()).hexdigest()[:32]
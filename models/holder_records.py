@@ -0,0 +1,157 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Documents a policy holder must have submitted before their record is complete
+REQUIRED_DOCUMENTS = ('identity_card', 'drivers_license', 'log_card')
+
+# Values that never overwrite a field already read from another document
+MISSING_VALUES = (None, '', 'Unknown')
+
+
+class KeyedLock:
+    """
+    One re-entrant lock per key, created on demand and dropped once nobody holds or
+    waits for it, so different keys never contend and idle keys cost nothing.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, number of holders and waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.RLock(), 0]
+            entry[1] += 1
+
+        entry[0].acquire()
+        try:
+            yield
+        finally:
+            entry[0].release()
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self):
+        with self._guard:
+            return len(self._locks)
+
+
+class HolderRecord:
+    __slots__ = ('key', 'fields', 'documents', 'completed')
+
+    def __init__(self, key):
+        self.key = key
+        self.fields = {}
+        self.documents = set()
+        self.completed = False
+
+
+class HolderAggregator:
+    """
+    Accumulates each policy holder's fields across their documents. Fields are merged one
+    by one, so a document never wipes out what another one contributed, and completion
+    is tracked per document type instead of by scanning for marker keys. When the last
+    required document arrives, `on_complete(key, fields)` is called once and the record
+    is dropped; if it fails (returns False or raises) the record is put back, so the
+    holder's next upload completes it again.
+
+    Updates are serialized per holder: concurrent uploads for one holder take turns,
+    while different holders never wait on each other. Records and locks only live in
+    this process; with OCR worker processes, a holder's documents all reach one worker
+    only because they come from one Telegram user (see get_worker_for()).
+    """
+
+    def __init__(self, on_complete=None, required_documents=REQUIRED_DOCUMENTS):
+        self.on_complete = on_complete
+        self.required_documents = frozenset(required_documents)
+        self._records = {}
+        self._holder_locks = KeyedLock()
+        self._records_lock = threading.Lock()  # Only guards the dict itself, never held for long
+
+    def lock(self, key):
+        """
+        Context manager holding the holder's lock, for callers that need a read-modify-write
+        of their own (e.g. a Firestore update) to be serialized with merges. Re-entrant.
+        """
+        return self._holder_locks.hold(key)
+
+    @staticmethod
+    def _merge_fields(record, fields):
+        for field, value in fields.items():
+            if value in MISSING_VALUES and field in record.fields:
+                continue
+            record.fields[field] = value
+
+    def merge(self, key, document_type, fields):
+        """
+        Merge one document's fields into the holder's record. Returns None if the record
+        isn't complete yet, otherwise whether `on_complete` succeeded (True without one).
+        """
+        with self._holder_locks.hold(key):
+            with self._records_lock:
+                record = self._records.get(key)
+                if record is None:
+                    record = self._records[key] = HolderRecord(key)
+
+            self._merge_fields(record, fields)
+            record.documents.add(document_type)
+
+            logger.info(f"{document_type} data for {key} merged into its holder record.")
+
+            if record.completed or not self.required_documents.issubset(record.documents):
+                return None
+
+            # Taken out under the holder's lock, so a racing upload starts a new record
+            # instead of a second send
+            record.completed = True
+            with self._records_lock:
+                del self._records[key]
+
+        # Outside the lock: the holder's other uploads needn't wait for Monday.com
+        if self.on_complete is None:
+            return True
+        try:
+            completed = bool(self.on_complete(key, dict(record.fields)))
+        except Exception as e:
+            logger.error(f"Completing the holder record of {key} failed: {e}")
+            completed = False
+
+        if not completed:
+            self._restore(record)
+        return completed
+
+    def _restore(self, record):
+        """
+        Put a record whose completion failed back, merged with whatever the holder's
+        uploads added since, so the next one retries the completion.
+        """
+        with self._holder_locks.hold(record.key):
+            record.completed = False
+            with self._records_lock:
+                newer = self._records.get(record.key)
+                self._records[record.key] = record
+            if newer is not None:
+                self._merge_fields(record, newer.fields)
+                record.documents |= newer.documents
+        logger.info(f"Holder record of {record.key} kept for another attempt.")
+
+    def get(self, key):
+        with self._holder_locks.hold(key):
+            with self._records_lock:
+                record = self._records.get(key)
+            return dict(record.fields) if record else {}
+
+    def pending_documents(self, key):
+        with self._holder_locks.hold(key):
+            with self._records_lock:
+                record = self._records.get(key)
+            documents = record.documents if record else set()
+            return sorted(self.required_documents - documents)
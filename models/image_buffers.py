@@ -0,0 +1,45 @@
+import os
+import weakref
+import threading
+import numpy as np
+
+# Scratch memory a thread may keep from one document to the next. A thread holding more
+# drops its buffers once a document is done, so one oversized upload doesn't keep RSS up
+SCRATCH_BUFFER_MAX_BYTES = int(float(os.getenv('SCRATCH_BUFFER_MAX_MB', '64')) * 1024 * 1024)
+
+# Per-thread scratch arrays reused by the enhancement stages across uploads
+_scratch = threading.local()
+_scratch_by_thread = weakref.WeakKeyDictionary()  # Thread -> its buffers, for trim_scratch_buffers()
+_scratch_by_thread_lock = threading.Lock()
+
+
+def scratch_buffer(slot, shape, dtype=np.uint8):
+    """
+    Return this thread's reusable array for `slot`, reallocated only when the requested
+    shape or dtype changes. The contents are overwritten by the next stage that asks for
+    the same slot on the same thread.
+    """
+    buffers = getattr(_scratch, 'buffers', None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+        with _scratch_by_thread_lock:
+            _scratch_by_thread[threading.current_thread()] = buffers
+
+    shape = tuple(shape)
+    buffer = buffers.get(slot)
+    if buffer is None or buffer.shape != shape or buffer.dtype != np.dtype(dtype):
+        buffer = buffers[slot] = np.empty(shape, dtype=dtype)
+    return buffer
+
+
+def trim_scratch_buffers(max_bytes=SCRATCH_BUFFER_MAX_BYTES):
+    """
+    Drop the scratch buffers of every thread holding more than `max_bytes` of them; 0
+    drops them all. Arrays a stage is still using stay valid, they just aren't reused.
+    """
+    with _scratch_by_thread_lock:
+        all_buffers = list(_scratch_by_thread.values())
+
+    for buffers in all_buffers:
+        if sum(buffer.nbytes for buffer in list(buffers.values())) > max_bytes:
+            buffers.clear()
@@ -0,0 +1,277 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from models.image_buffers import scratch_buffer
+from models.concurrency import available_cores, current_job_threads
+
+logger = logging.getLogger(__name__)
+
+# Enhancement profiles: 'fast' only converts to grayscale, 'binarize' deskews and thresholds at
+# native resolution, 'full' upscales, denoises and sharpens
+ENHANCEMENT_PROFILES = ('fast', 'binarize', 'full')
+
+# How much each profile upscales the image
+ENHANCEMENT_SCALE = {'fast': 1.0, 'binarize': 1.0, 'full': 2.0}
+
+# Sharpening kernel
+SHARPEN_KERNEL = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+
+# NL-means denoising strength and window sizes
+NLMEANS_H = 10
+NLMEANS_TEMPLATE_WINDOW = 7
+NLMEANS_SEARCH_WINDOW = 21
+
+# Tile threads of this process for the 'full' profile's denoise and sharpen, which run as
+# overlapping horizontal tiles. A job uses as many as its thread budget allows (see
+# current_job_threads()), so concurrent jobs don't each spread over every core; 1 turns tiling off.
+# Only cascades that opt into 'full' tile, the default OCR_CASCADE doesn't run it
+ENHANCE_TILE_WORKERS = int(os.getenv('ENHANCE_TILE_WORKERS', '0')) or available_cores()
+
+# Rows a tile reads beyond its own on either side: the NL-means search and template radius plus
+# the sharpening kernel's, so every output pixel sees the same neighbours as untiled and no seam shows
+TILE_HALO = NLMEANS_SEARCH_WINDOW // 2 + NLMEANS_TEMPLATE_WINDOW // 2 + SHARPEN_KERNEL.shape[0] // 2
+
+# Smaller tiles spend more time on their halo than on their own rows
+MIN_TILE_ROWS = 4 * TILE_HALO
+
+# Deskew: angles searched either way (degrees), search step, and the smallest skew worth a rotation
+DESKEW_MAX_ANGLE = 10.0
+DESKEW_STEP = 0.5
+DESKEW_MIN_ANGLE = 0.3
+
+# Width the skew is estimated at; the projection profile doesn't need full resolution
+DESKEW_ESTIMATE_WIDTH = 600
+
+# Sauvola thresholding: window size (odd, pixels), sensitivity k and dynamic range R of the deviation
+SAUVOLA_WINDOW = 31
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128.0
+
+# Denoise/sharpen tiles run here, separate from the page threads that submit them
+_tile_executor = None
+
+
+def estimate_skew(image):
+    """
+    Estimate the rotation (degrees, counter-clockwise) that levels the text of a grayscale
+    image, from its horizontal projection profile: the row sums of ink are sharpest when
+    the text lines are horizontal.
+    """
+    import cv2
+
+    scale = min(1.0, DESKEW_ESTIMATE_WIDTH / image.shape[1])
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    height, width = ink.shape
+    rotated = np.empty_like(ink)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP):
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        cv2.warpAffine(ink, matrix, (width, height), dst=rotated, flags=cv2.INTER_NEAREST)
+        rows = rotated.sum(axis=1, dtype=np.float64)
+        score = np.square(np.diff(rows)).sum()
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def rotate_image(image, angle, slot):
+    """
+    Rotate a grayscale image by `angle` degrees around its centre onto a white canvas grown
+    to fit, in the scratch buffer `slot`. Returns (rotated, matrix), `matrix` being the 2x3
+    affine transform from source to rotated pixels.
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(np.ceil(height * sin + width * cos))
+    new_height = int(np.ceil(height * cos + width * sin))
+    matrix[0, 2] += (new_width - width) / 2
+    matrix[1, 2] += (new_height - height) / 2
+
+    rotated = scratch_buffer(slot, (new_height, new_width), image.dtype)
+    cv2.warpAffine(image, matrix, (new_width, new_height), dst=rotated, flags=cv2.INTER_LINEAR,
+                   borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    return rotated, matrix
+
+
+def sauvola_threshold(image, window=SAUVOLA_WINDOW, k=SAUVOLA_K, r=SAUVOLA_R):
+    """
+    Binarize a grayscale image with Sauvola's local threshold T = m * (1 + k * (s / R - 1)),
+    m and s being the mean and standard deviation of each pixel's window. The window sums
+    are box filters, so the cost doesn't grow with the window. Returns ink as 0 and paper
+    as 255 in a scratch buffer.
+    """
+    import cv2
+
+    shape = image.shape
+    mean = scratch_buffer('sauvola_mean', shape, np.float32)
+    deviation = scratch_buffer('sauvola_deviation', shape, np.float32)
+    threshold = scratch_buffer('sauvola_threshold', shape, np.float32)
+    cv2.boxFilter(image, cv2.CV_32F, (window, window), dst=mean, borderType=cv2.BORDER_REPLICATE)
+    cv2.sqrBoxFilter(image, cv2.CV_32F, (window, window), dst=deviation, borderType=cv2.BORDER_REPLICATE)
+
+    # s = sqrt(E[x^2] - m^2)
+    np.multiply(mean, mean, out=threshold)
+    np.subtract(deviation, threshold, out=deviation)
+    np.maximum(deviation, 0, out=deviation)
+    np.sqrt(deviation, out=deviation)
+
+    # T = m * (1 + k * (s / R - 1))
+    np.multiply(deviation, k / r, out=deviation)
+    np.add(deviation, 1 - k, out=deviation)
+    np.multiply(mean, deviation, out=threshold)
+
+    # Compare in float; the deviation buffer is free again
+    np.copyto(deviation, image)
+    binary = scratch_buffer('binary', shape, np.uint8)
+    cv2.compare(deviation, threshold, cv2.CMP_GT, dst=binary)
+    return binary
+
+
+def get_tile_executor():
+    global _tile_executor
+    if _tile_executor is None:
+        _tile_executor = ThreadPoolExecutor(max_workers=ENHANCE_TILE_WORKERS, thread_name_prefix='enhance-tile')
+    return _tile_executor
+
+
+def _denoise_and_sharpen_tile(source, output, top, bottom):
+    import cv2
+
+    read_top = max(0, top - TILE_HALO)
+    read_bottom = min(source.shape[0], bottom + TILE_HALO)
+    band = source[read_top:read_bottom]
+
+    # Scratch buffers of whichever thread runs the tile
+    denoised = scratch_buffer('tile_denoised', band.shape, band.dtype)
+    cv2.fastNlMeansDenoising(band, denoised, h=NLMEANS_H, templateWindowSize=NLMEANS_TEMPLATE_WINDOW,
+                             searchWindowSize=NLMEANS_SEARCH_WINDOW)
+    sharpened = scratch_buffer('tile_sharpened', band.shape, band.dtype)
+    cv2.filter2D(denoised, -1, SHARPEN_KERNEL, dst=sharpened)
+
+    # Keep only the tile's own rows; the halo was there to give them their full neighbourhood
+    output[top:bottom] = sharpened[top - read_top:bottom - read_top]
+
+
+def denoise_and_sharpen(source, output, threads=None):
+    """
+    NL-means denoise and sharpen a grayscale image into `output`. Images tall enough are
+    split into horizontal tiles with TILE_HALO rows of overlap and run in parallel on up to
+    `threads` tile threads (default: the job's budget; OpenCV releases the GIL); each tile
+    writes only its own rows, so the result matches the untiled one.
+    """
+    rows = source.shape[0]
+    tiles = min(threads or current_job_threads(), ENHANCE_TILE_WORKERS, rows // MIN_TILE_ROWS)
+    if tiles <= 1:
+        _denoise_and_sharpen_tile(source, output, 0, rows)
+        return output
+
+    bounds = np.linspace(0, rows, tiles + 1, dtype=int)
+    futures = [
+        get_tile_executor().submit(_denoise_and_sharpen_tile, source, output, top, bottom)
+        for top, bottom in zip(bounds[:-1], bounds[1:])
+    ]
+    for future in futures:
+        future.result()
+    return output
+
+
+def to_source_pixels(boxes, transform):
+    """
+    Map OCR boxes (n, 4, 2) found on an enhanced image back to source image pixels, given
+    the 2x3 `transform` enhance_image() reported.
+    """
+    inverse = np.linalg.inv(np.vstack([transform, [0, 0, 1]]))[:2]
+    return (boxes @ inverse[:, :2].T + inverse[:, 2]).astype(np.float32)
+
+# Function to enhance an already decoded image using OpenCV
+def enhance_image(image, profile='full', return_transform=False, reuse_buffers=False, tile_threads=None):
+    """
+    Enhance a decoded image for OCR and return it as a single-channel (grayscale) image,
+    which both OCR engines take as-is. Every stage writes into this thread's scratch
+    buffers (OpenCV dst= parameters) instead of allocating a new array. The result is a
+    copy, unless `reuse_buffers` is set: then it may be a scratch buffer (or `image`
+    itself), only valid until the next call on the same thread.
+
+    With `return_transform`, returns (image, transform): the 2x3 affine transform from
+    source to enhanced pixels, covering the upscale and deskew rotation. `tile_threads`
+    caps the threads the 'full' profile's tiles run on (see denoise_and_sharpen()).
+    """
+    if not reuse_buffers:
+        result = enhance_image(image, profile, return_transform, reuse_buffers=True, tile_threads=tile_threads)
+        if return_transform:
+            return result[0].copy(), result[1]
+        return result.copy()
+
+    import cv2
+
+    if profile not in ENHANCEMENT_PROFILES:
+        raise ValueError(f"Unknown enhancement profile: {profile}")
+
+    # Card OCR doesn't need colour: drop to one channel before anything else, so every
+    # later stage touches a third of the bytes. Uploads are normally decoded as grayscale already
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=scratch_buffer('gray', image.shape[:2], image.dtype))
+
+    # The fast profile skips the expensive steps, most clean uploads are readable as-is
+    if profile == 'fast':
+        return (image, np.eye(2, 3)) if return_transform else image
+
+    # Binarize: level the text and threshold it locally, so Tesseract can read it at native
+    # resolution instead of relying on an upscale and heavy denoising
+    if profile == 'binarize':
+        transform = np.eye(2, 3)
+        angle = estimate_skew(image)
+        if abs(angle) >= DESKEW_MIN_ANGLE:
+            image, transform = rotate_image(image, angle, 'deskewed')
+
+        # Take out JPEG speckle first, the local threshold would turn it into ink
+        smoothed = scratch_buffer('smoothed', image.shape, image.dtype)
+        cv2.medianBlur(image, 3, dst=smoothed)
+        binary = sauvola_threshold(smoothed)
+        return (binary, transform) if return_transform else binary
+
+    # Step 1: Resize the image to a higher resolution (optional, based on use case)
+    scale_percent = ENHANCEMENT_SCALE[profile] * 100  # Increase the image size by 200%
+    width = int(image.shape[1] * scale_percent / 100)
+    height = int(image.shape[0] * scale_percent / 100)
+    shape = (height, width)
+    resized_image = scratch_buffer('resized', shape, image.dtype)
+    cv2.resize(image, (width, height), dst=resized_image, interpolation=cv2.INTER_LINEAR)
+
+    # Steps 2 and 3: Denoise, then sharpen for better clarity, tile-parallel on large images.
+    # The tiles read the resized image while writing, so the output needs its own buffer
+    enhanced_image = denoise_and_sharpen(resized_image, scratch_buffer('denoised', shape, image.dtype), tile_threads)
+
+    if return_transform:
+        scale = ENHANCEMENT_SCALE[profile]
+        return enhanced_image, np.array([[scale, 0, 0], [0, scale, 0]], dtype=np.float64)
+    return enhanced_image
+
+# Function to enhance image quality using OpenCV
+def enhance_image_quality(image_path, profile='full'):
+    import cv2
+
+    try:
+        # Check if the file exists at the given path
+        if not os.path.exists(image_path):
+            raise ValueError(f"Image file at {image_path} does not exist.")
+
+        # Read the image, decoding straight to grayscale
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError(f"Image at {image_path} could not be loaded. Check file path or integrity.")
+
+        enhanced_image = enhance_image(image, profile=profile)
+
+        logger.info(f"Image at {image_path} enhanced successfully.")
+        return enhanced_image
+
+    except Exception as e:
+        logger.error(f"Error enhancing image quality: {e}")
+        return None
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import atexit
+import logging
+import resource
+import functools
+import threading
+import tracemalloc
+import contextvars
+import multiprocessing
+import multiprocessing.util
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Allocation sites kept per stage in the report
+MEMORY_PROFILE_TOP_SITES = 10
+
+# Tags that tell apart stages of the same name, e.g. 'ocr:tesseract/fast'
+STAGE_TAGS = ('engine', 'profile')
+
+_enabled = False
+_document_type = contextvars.ContextVar('memory_profile_document_type', default=None)
+_open_peaks = []  # [peak so far] of every stage open in any thread
+_open_peaks_lock = threading.Lock()
+_reports = {}  # document_type -> stage -> StageMemory
+_reports_lock = threading.Lock()
+
+# Allocations made by the profiler itself, or by importing code, aren't the pipeline's
+_IGNORED_FILES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>',
+                  '<frozen importlib._bootstrap_external>', '<unknown>')
+
+
+# MEMORY_PROFILE, MEMORY_PROFILE_DIR and MEMORY_PROFILE_FRAMES are read when used rather than
+# on import, so values loaded from .env afterwards still count
+def profiling_requested():
+    """
+    Whether MEMORY_PROFILE asks for opt-in memory profiling of the document pipeline: every
+    traced stage (decode, enhance, ocr, parse, firestore.write, ...) records its peak
+    allocation, the memory it left allocated and its RSS growth, attributed to the document
+    type being processed. Slows OCR down noticeably.
+    """
+    return os.getenv('MEMORY_PROFILE', 'false').lower() == 'true'
+
+
+def report_dir():
+    return os.getenv('MEMORY_PROFILE_DIR', os.path.join(os.getcwd(), 'memory_profile'))
+
+
+def traced_frames():
+    # Stack frames kept per allocation; 1 attributes each one to the line that made it
+    return int(os.getenv('MEMORY_PROFILE_FRAMES', '1'))
+
+
+class StageMemory:
+    __slots__ = ('calls', 'peak_bytes_max', 'peak_bytes_total', 'retained_bytes_total', 'rss_delta_max', 'sites')
+
+    def __init__(self):
+        self.calls = 0
+        self.peak_bytes_max = 0
+        self.peak_bytes_total = 0
+        self.retained_bytes_total = 0
+        self.rss_delta_max = 0
+        self.sites = Counter()  # 'file:line' -> bytes still allocated at the end of the stage, summed over calls
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'peak_bytes_max': self.peak_bytes_max,
+            'peak_bytes_mean': self.peak_bytes_total // self.calls,
+            'retained_bytes_mean': self.retained_bytes_total // self.calls,
+            'rss_delta_max': self.rss_delta_max,
+            'top_sites': [{'site': site, 'retained_bytes': size}
+                          for site, size in self.sites.most_common(MEMORY_PROFILE_TOP_SITES)],
+        }
+
+
+def enable(frames=None, write_at_exit=True):
+    """
+    Start recording. Call as early as possible in the process; allocations made before are
+    invisible. Reports are written to report_dir() when the process exits, unless
+    `write_at_exit` is False.
+    """
+    global _enabled
+    if _enabled:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or traced_frames())
+    _enabled = True
+    if write_at_exit:
+        atexit.register(write_reports)
+        if multiprocessing.parent_process() is not None:
+            # Worker processes exit without running atexit hooks, but run these
+            multiprocessing.util.Finalize(None, write_reports, exitpriority=10)
+        logger.info(f"Memory profiling on, reports go to {report_dir()}.")
+
+
+def is_enabled():
+    return _enabled
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes. Where /proc isn't available (macOS) this is
+    the peak RSS so far instead, so deltas there only show growth of the high-water mark.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _stage_key(name, tags):
+    variant = '/'.join(str(tags[tag]) for tag in STAGE_TAGS if tag in (tags or {}))
+    return f"{name}:{variant}" if variant else name
+
+
+def _top_sites(before, after):
+    sites = Counter()
+    for difference in after.compare_to(before, 'lineno'):
+        frame = difference.traceback[0]
+        if difference.size_diff > 0 and frame.filename not in _IGNORED_FILES:
+            sites[f"{frame.filename}:{frame.lineno}"] += difference.size_diff
+    return sites.most_common(MEMORY_PROFILE_TOP_SITES)
+
+
+def _credit_peak():
+    """
+    Credit the peak since the last reset to every open stage, then start a new one. The
+    peak is process-wide, so it is never reset without the open stages getting theirs.
+    Called with _open_peaks_lock held.
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    for entry in _open_peaks:
+        entry[0] = max(entry[0], peak)
+    tracemalloc.reset_peak()
+
+
+@contextmanager
+def profile_stage(name, tags=None):
+    """
+    Record one stage's memory under the current document type. Only Python and numpy
+    allocations are traced; native memory inside OpenCV, torch or Tesseract only shows in
+    the RSS delta. Peaks are per process, so stages overlapping in other threads count
+    towards each other's; profile one document at a time for exact figures.
+    """
+    if not _enabled:
+        yield
+        return
+
+    before = tracemalloc.take_snapshot()
+    start_rss = current_rss()
+    entry = [0]
+    with _open_peaks_lock:
+        _credit_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        _open_peaks.append(entry)
+
+    try:
+        yield
+    finally:
+        with _open_peaks_lock:
+            _credit_peak()
+            _open_peaks.remove(entry)
+            end_bytes = tracemalloc.get_traced_memory()[0]
+        peak_bytes = max(entry[0], start_bytes)
+        rss_delta = current_rss() - start_rss
+        sites = _top_sites(before, tracemalloc.take_snapshot())
+
+        with _reports_lock:
+            stages = _reports.setdefault(_document_type.get() or 'unknown', {})
+            stage = stages.setdefault(_stage_key(name, tags), StageMemory())
+            stage.calls += 1
+            stage.peak_bytes_max = max(stage.peak_bytes_max, peak_bytes - start_bytes)
+            stage.peak_bytes_total += peak_bytes - start_bytes
+            stage.retained_bytes_total += end_bytes - start_bytes
+            stage.rss_delta_max = max(stage.rss_delta_max, rss_delta)
+            stage.sites.update(dict(sites))
+
+
+def profile_document(document_type):
+    """
+    Decorator for the process_* functions: stages run inside are reported under
+    `document_type`, next to a 'total' stage for the whole call.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+
+            token = _document_type.set(document_type)
+            try:
+                with profile_stage('total'):
+                    return function(*args, **kwargs)
+            finally:
+                _document_type.reset(token)
+        return wrapper
+    return decorator
+
+
+def memory_report():
+    """
+    Everything recorded so far: document_type -> stage -> figures (bytes).
+    """
+    with _reports_lock:
+        return {document_type: {key: stage.as_dict() for key, stage in sorted(stages.items())}
+                for document_type, stages in _reports.items()}
+
+
+def write_reports(directory=None, name_format='{document_type}.{pid}.json'):
+    """
+    Write one JSON report per document type to `directory` (report_dir() by default). The
+    default names carry the process ID, so OCR worker processes don't overwrite each other's.
+    """
+    report = memory_report()
+    if not report:
+        return []
+
+    directory = directory or report_dir()
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for document_type, stages in report.items():
+        path = os.path.join(directory, name_format.format(document_type=document_type, pid=os.getpid()))
+        with open(path, 'w') as f:
+            json.dump({'document_type': document_type, 'stages': stages}, f, indent=2)
+        paths.append(path)
+    return paths
+
+
+def format_report(report):
+    """
+    The report as a table per document type, largest peak first.
+    """
+    lines = []
+    for document_type, stages in sorted(report.items()):
+        lines.append(f"{document_type}")
+        lines.append(f"  {'stage':<28} {'calls':>5} {'peak MB':>8} {'mean MB':>8} {'kept MB':>8} {'RSS +MB':>8}  top site")
+        for key, stage in sorted(stages.items(), key=lambda item: -item[1]['peak_bytes_max']):
+            top_site = stage['top_sites'][0]['site'] if stage['top_sites'] else ''
+            lines.append(f"  {key:<28} {stage['calls']:>5} {stage['peak_bytes_max'] / 1e6:>8.1f} "
+                         f"{stage['peak_bytes_mean'] / 1e6:>8.1f} {stage['retained_bytes_mean'] / 1e6:>8.1f} "
+                         f"{stage['rss_delta_max'] / 1e6:>8.1f}  {top_site}")
+    return '\n'.join(lines)
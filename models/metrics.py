@@ -0,0 +1,56 @@
+import os
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from models.warm_up import is_ready, warm_up_durations
+
+logger = logging.getLogger(__name__)
+
+# Port of the HTTP readiness probe (GET /ready: 200 once warmed up, 503 before) and of the
+# metrics registered with register_metrics() (GET /metrics, JSON). Off when unset
+READINESS_PORT = int(os.getenv('READINESS_PORT', '0'))
+
+_metrics = {}  # Name -> function returning a JSON-serializable snapshot
+
+
+def register_metrics(name, provider):
+    """
+    Serve `provider()` under `name` at GET /metrics.
+    """
+    _metrics[name] = provider
+
+
+class _ReadinessHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            status, payload = 200, {name: provider() for name, provider in list(_metrics.items())}
+        elif self.path in ('/ready', '/'):
+            status, payload = (200 if is_ready() else 503), {'ready': is_ready(), 'warm_up_seconds': warm_up_durations()}
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Probes every few seconds would drown the bot's own log
+
+
+def serve_readiness(port=READINESS_PORT):
+    """
+    Answer readiness probes from a background thread. Returns the server, or None if no
+    port is configured.
+    """
+    if not port:
+        return None
+
+    server = ThreadingHTTPServer(('', port), _ReadinessHandler)
+    threading.Thread(target=server.serve_forever, name='readiness', daemon=True).start()
+    logger.info(f"Readiness probe listening on port {port} (GET /ready, GET /metrics).")
+    return server
@@ -3,127 +3,29 @@ import logging
 import re  # For regex pattern matching
 import json  # <-- Added this import
 from dotenv import load_dotenv
-import requests
-from fpdf import FPDF
-from PIL import Image, ImageEnhance, ImageFilter  # For image preprocessing
-import pytesseract
-import cv2
-import numpy as np
-import easyocr  # Import EasyOCR for driver's license processing
-from flask import Flask, request
-from firebase_admin import firestore  # Add this import for Firestore
-from database.firebase_init import initialize_firestore  # Assuming firebase_init is your module for initializing Firestore
-from google.cloud.exceptions import GoogleCloudError
-
-
-
-app = Flask(__name__)  # Define the Flask app
 
-# Set the path to the Tesseract executable
-pytesseract.pytesseract.tesseract_cmd = '/opt/homebrew/bin/tesseract'
+# Before the modules below read their settings from the environment on import
 load_dotenv()
 
-logger = logging.getLogger(__name__)
-
-# Get the AI model endpoint from environment variables
-AI_MODEL_ENDPOINT = os.getenv('AI_MODEL_ENDPOINT')
-
-# Create a folder to store PDFs if it doesn't exist
-PDF_FOLDER = os.path.join(os.getcwd(), 'pdf_folder')
-os.makedirs(PDF_FOLDER, exist_ok=True)
-
-# Path to the DejaVuSansCondensed.ttf file
-FONT_PATH = os.getenv('FONT_PATH')
-
-# Class for handling Unicode characters in PDFs using DejaVuSansCondensed.ttf
-class UTF8FPDF(FPDF):
-    def __init__(self):
-        super().__init__()
-        # Add the DejaVuSansCondensed font
-        self.add_font('DejaVu', '', FONT_PATH, uni=True)
-
-def create_selectable_pdf_from_image(image_path, pdf_path):
-    try:
-        # Create a new PDF with UTF-8 support
-        pdf = UTF8FPDF()
-        pdf.add_page()
-
-        # Add the image to the PDF
-        pdf.image(image_path, x=10, y=10, w=190)
-
-        # Save the PDF
-        pdf.output(pdf_path)
-        logger.info(f"Created selectable PDF at {pdf_path}")
-        return True
-    except Exception as e:
-        logger.error(f"Error creating selectable PDF: {e}")
-        return False
-
-# Function to enhance image quality using OpenCV
-def enhance_image_quality(image_path):
-    try:
-        # Check if the file exists at the given path
-        if not os.path.exists(image_path):
-            raise ValueError(f"Image file at {image_path} does not exist.")
-        
-        # Read the image
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Image at {image_path} could not be loaded. Check file path or integrity.")
-        
-        # Step 1: Resize the image to a higher resolution (optional, based on use case)
-        scale_percent = 200  # Increase the image size by 200%
-        width = int(image.shape[1] * scale_percent / 100)
-        height = int(image.shape[0] * scale_percent / 100)
-        resized_image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
-
-        # Step 2: Apply denoising to reduce noise
-        denoised_image = cv2.fastNlMeansDenoisingColored(resized_image, None, h=10, templateWindowSize=7, searchWindowSize=21)
-
-        # Step 3: Sharpen the image for better clarity
-        kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])  # Sharpening kernel
-        sharpened_image = cv2.filter2D(denoised_image, -1, kernel)
-
-        logger.info(f"Image at {image_path} enhanced successfully.")
-        return sharpened_image
-
-    except Exception as e:
-        logger.error(f"Error enhancing image quality: {e}")
-        return None
-
-# Function to extract text from an image using pytesseract and display it on the terminal
-def extract_text_from_image(image_path):
-    try:
-        # Enhance the image quality first
-        enhanced_image = enhance_image_quality(image_path)
-        
-        if enhanced_image is None:
-            logger.error("Image enhancement failed. Cannot proceed with OCR.")
-            return None
-        
-        # Convert OpenCV image to PIL Image for pytesseract
-        enhanced_image = cv2.cvtColor(enhanced_image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(enhanced_image)
-
-        # Perform OCR to extract text from the enhanced image
-        text = pytesseract.image_to_string(pil_image)
-        
-        if text.strip():
-            # Display extracted text on the terminal
-            print("\n--- Extracted Text from Image ---\n")
-            print(text)
-            print("\n--- End of Extracted Text ---\n")
-        else:
-            print("No text was extracted from the image.")
-
-        return text
+import numpy as np
+from models.ocr_engine import OCRResult, run_ocr_cascade
+from models.cancellation import raise_if_cancelled
+from models.tracing import span
+from models.memory_profile import profile_document
+from models.firestore_writer import get_firestore_writer, pending_document
+from models.ocr_layout import group_lines, merge_words, extract_labelled_fields
+from models.holder_records import HolderAggregator
+from models.holder_keys import holder_key_for
+from models.pdf_export import export_searchable_pdf
+from models.validation import FIELD_VALIDATORS, correct_document, cross_check
+
+# Heavy dependencies (OpenCV, Tesseract, EasyOCR/torch, Firebase, requests) are imported
+# inside the functions that use them, so importing this module stays cheap
 
-    except Exception as e:
-        logger.error(f"Failed to extract text from image: {e}")
-        return None
+logger = logging.getLogger(__name__)
 
 # ss
-# Function to convert EasyOCR result to JSON (for debugging or logging)
+# Function to convert an OCR result to JSON (for debug logging only)
 def convert_to_json(result):
     data = []
     for (bbox, text, confidence) in result:
@@ -139,15 +41,66 @@ def convert_to_json(result):
 
 identitycard_name = {}
 
+# Fields the OCR cascade must read confidently before it stops escalating to heavier engines
+IDENTITY_CARD_REQUIRED_FIELDS = ('Identity_Card_No', 'Name')
+DRIVERS_LICENSE_REQUIRED_FIELDS = ('License_Number', 'Birth_Date')
+LOG_CARD_REQUIRED_FIELDS = ('Vehicle_No', 'Make_Model')
+REQUIRED_FIELDS = {
+    'identity_card': IDENTITY_CARD_REQUIRED_FIELDS,
+    'drivers_license': DRIVERS_LICENSE_REQUIRED_FIELDS,
+    'log_card': LOG_CARD_REQUIRED_FIELDS,
+}
+
+def parse_document(document_type, ocr_result):
+    """
+    Parse one OCR cascade stage's result into the document's fields, with checksum-carrying
+    fields already corrected.
+    """
+    if document_type == 'identity_card':
+        fields = parse_extracted_text(ocr_result.text)
+    elif document_type == 'drivers_license':
+        fields = extract_drivers_license_data(ocr_result)
+    else:
+        fields = parse_log_card_text(ocr_result.text)
+    return correct_document(document_type, fields)
+
+def validate_against_holder(holder_key, document_type, fields):
+    """
+    Cross-check a document's parsed fields against the documents the holder already
+    submitted. Fields another document's checksum settles are corrected in place; the
+    disagreements left are logged and returned for the record.
+    """
+    other_fields = holder_records.get(holder_key) if holder_key else {}
+    if document_type == 'drivers_license':
+        fields_to_check = {**other_fields, **fields, 'License_Name': fields.get('Name')}
+        fields_to_check['Name'] = other_fields.get('Name')
+    else:
+        fields_to_check = {**other_fields, **fields}
+
+    corrections, issues = cross_check(fields_to_check)
+    for field, value in corrections.items():
+        if field in fields:
+            logger.info(f"Corrected {document_type} {field} to {value} from the holder's other documents.")
+            fields[field] = value
+
+    for issue in issues:
+        logger.warning(f"Validation issue for holder {holder_key}: {issue}")
+    return issues
+
+@profile_document('identity_card')
 def process_identity_card(image_path, user_id):
-    # Extract text from the saved image
-    extracted_text = extract_text_from_image(image_path)
+    from firebase_admin import firestore
 
-    if extracted_text:
-        logger.info("Text successfully extracted from the uploaded identity card.")
+    # Extract and parse the text, escalating to heavier OCR only if needed
+    parsed_data, ocr_result = run_ocr_cascade(
+        image_path,
+        parse=lambda ocr_result: parse_document('identity_card', ocr_result),
+        required_fields=IDENTITY_CARD_REQUIRED_FIELDS,
+        validators=FIELD_VALIDATORS
+    )
 
-        # Parse the extracted text to structured data
-        parsed_data = parse_extracted_text(extracted_text)
+    if ocr_result:
+        logger.info("Text successfully extracted from the uploaded identity card.")
 
         if not parsed_data:
             logger.error("Parsed data is empty. Unable to process identity card.")
@@ -163,6 +116,15 @@ def process_identity_card(image_path, user_id):
 
         logger.info(f"Sanitized name generated: {sanitized_name}")
 
+        # Key the holder by their hashed ID number, not their name
+        holder_key = holder_key_for(parsed_data.get('Identity_Card_No'))
+
+        # Check against the holder's other documents, if they came first
+        validation_issues = validate_against_holder(holder_key, 'identity_card', parsed_data)
+
+        # A superseded upload must not overwrite what the newer one writes, nor export its PDF
+        raise_if_cancelled('parse')
+
         # Store the sanitized name in the global dictionary using user_id as key
         identitycard_name[user_id] = sanitized_name
 
@@ -173,41 +135,47 @@ def process_identity_card(image_path, user_id):
             'Date_of_birth': parsed_data.get('Date_of_birth', "Unknown"),
             'Sex': parsed_data.get('Sex', "Unknown"),
             'Place_of_birth': parsed_data.get('Place_of_birth', "Unknown"),
-            'sanitized_name': sanitized_name,
+            'sanitized_name': sanitized_name,  # Single-field indexed, so lookups by name are one query
+            'holder_key': holder_key,
+            'validation_issues': validation_issues or None,
+            'user_id': user_id,
             'timestamp': firestore.SERVER_TIMESTAMP,
-            'image_path': image_path
+            'image_path': image_path,
+            'pdf_path': export_searchable_pdf(image_path, ocr_result)
         }
         filtered_doc_data = {k: v for k, v in doc_data.items() if v is not None}
 
         try:
-            # Save the identity card data to Firestore
-            db = initialize_firestore()
-            doc_ref = db.collection('policy_holders').document(sanitized_name)
-            doc_ref.set(filtered_doc_data)
-
-            logger.info(f"Identity Card data successfully saved to Firestore under policy_holders/{sanitized_name}.")
+            # Queue the identity card data for Firestore; the write replaces the holder document,
+            # so it is queued under the holder's lock to stay in order with other uploads for the holder
+            with span('firestore.write', document_type='identity_card'):
+                writer = get_firestore_writer()
+                with holder_records.lock(holder_key):
+                    writer.set(f"policy_holders/{holder_key}", filtered_doc_data)
+
+                # Point the Telegram user at their holder, so later uploads find it with one read
+                if user_id:
+                    writer.set(f"users/{user_id}", {'holder_key': holder_key, 'sanitized_name': sanitized_name})
+
+            logger.info(f"Identity Card data queued for Firestore under policy_holders/{holder_key}.")
         
         except Exception as e:
-            logger.error(f"Failed to save identity card data to Firestore: {e}")
+            logger.error(f"Failed to queue identity card data for Firestore: {e}")
             return None
 
-        # Now update the `data_into_monday` for this user
-        if sanitized_name not in data_into_monday:
-            data_into_monday[sanitized_name] = {}
-
-        data_into_monday[sanitized_name].update({
+        # Merge into the holder's record; the last of the three documents sends it to Monday
+        submitted = holder_records.merge(holder_key, 'identity_card', {
             'sanitized_name': sanitized_name,
+            'Name': name,
             'Identity_Card_No': parsed_data.get('Identity_Card_No', 'Unknown'),
             'Race': parsed_data.get('Race', 'Unknown'),
             'Date_of_birth': parsed_data.get('Date_of_birth', 'Unknown'),
             'Sex': parsed_data.get('Sex', 'Unknown'),
             'Place_of_birth': parsed_data.get('Place_of_birth', 'Unknown')
         })
-
-        logger.info(f"Identity card data for {sanitized_name} added to data_into_monday.")
-
-        # Check if all required documents are processed and send data to Monday
-        check_and_send_to_monday(sanitized_name)
+        if submitted is not None:
+            # This document completed the holder's record. A copy: the queued Firestore write holds the original
+            filtered_doc_data = {**filtered_doc_data, 'holder_submitted': submitted}
 
         # Return the document data as a dictionary
         return filtered_doc_data
@@ -215,69 +183,67 @@ def process_identity_card(image_path, user_id):
         logger.error("Failed to extract text from the image.")
         return None
 
-def process_drivers_license(image_path, sanitized_name):
-    try:
-        logger.info(f"Processing driver's license for sanitized_name: {sanitized_name}")
+@profile_document('drivers_license')
+def process_drivers_license(image_path, holder_key):
+    from firebase_admin import firestore
 
-        # Initialize the EasyOCR reader
-        reader = easyocr.Reader(['en'])
-
-        # Read the image
-        img = cv2.imread(image_path)
-
-        if img is None:
-            logger.error(f"Error: Unable to load image at {image_path}")
+    try:
+        logger.info(f"Processing driver's license for holder: {holder_key}")
+
+        # Extract relevant fields from the OCR result, escalating to heavier OCR only if needed
+        license_data, result = run_ocr_cascade(
+            image_path,
+            parse=lambda ocr_result: parse_document('drivers_license', ocr_result),
+            required_fields=DRIVERS_LICENSE_REQUIRED_FIELDS,
+            validators=FIELD_VALIDATORS
+        )
+
+        if license_data is None:
+            logger.error(f"Error: Unable to extract text from image at {image_path}")
             return None
 
-        # Convert the image to grayscale for better OCR accuracy
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        # Serializing the OCR result is only worth it when someone is reading debug logs
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"OCR Result for Driver's License: {convert_to_json(result)}")
 
-        # Use EasyOCR to extract text from the grayscale image
-        result = reader.readtext(img_gray)
-        json_result = convert_to_json(result)
-        logger.info(f"OCR Result for Driver's License: {json_result}")
+        # Check against the holder's other documents, if they came first
+        validation_issues = validate_against_holder(holder_key, 'drivers_license', license_data)
 
-        # Extract relevant fields from the OCR result (as much as possible)
-        license_data = extract_drivers_license_data(result)
+        # A superseded upload must not overwrite what the newer one writes, nor export its PDF
+        raise_if_cancelled('parse')
 
         # Prepare Firestore document data for the driver's license
         doc_data = {
             'License_Number': license_data.get('License_Number', 'Unknown'),
             'Birth_Date': license_data.get('Birth_Date'),
             'Issue_Date': license_data.get('Issue_Date'),
+            'validation_issues': validation_issues or None,
             'timestamp': firestore.SERVER_TIMESTAMP,
-            'image_path': image_path
+            'image_path': image_path,
+            'pdf_path': export_searchable_pdf(image_path, result)
         }
         filtered_doc_data = {k: v for k, v in doc_data.items() if v is not None}
-        try:
-            # Save the driver's license data to Firestore
-            db = initialize_firestore()
-            doc_ref = db.collection('policy_holders').document(sanitized_name)
 
-            # Save the driver's license data in the `drivers_license` subcollection
-            subcollection_ref = doc_ref.collection('drivers_license').document()
-            subcollection_ref.set(filtered_doc_data)
+        try:
+            # Queue the driver's license data for the holder's `drivers_license` subcollection
+            with span('firestore.write', document_type='drivers_license'):
+                get_firestore_writer().add(f"policy_holders/{holder_key}/drivers_license", filtered_doc_data)
 
-            logger.info(f"Driver's License data successfully saved to Firestore under policy_holders/{sanitized_name}/drivers_license.")
+            logger.info(f"Driver's License data queued for Firestore under policy_holders/{holder_key}/drivers_license.")
 
         except Exception as e:
-            logger.error(f"Failed to save driver's license data to Firestore: {e}")
+            logger.error(f"Failed to queue driver's license data for Firestore: {e}")
             return None
 
-        # Update the `data_into_monday` for this user
-        if sanitized_name not in data_into_monday:
-            data_into_monday[sanitized_name] = {}
-
-        data_into_monday[sanitized_name].update({
+        # Merge into the holder's record; the last of the three documents sends it to Monday
+        submitted = holder_records.merge(holder_key, 'drivers_license', {
             'License_Number': license_data.get('License_Number', 'Unknown'),
             'Birth_Date': license_data.get('Birth_Date', 'Unknown'),
-            'Issue_Date': license_data.get('Issue_Date', 'Unknown')
+            'Issue_Date': license_data.get('Issue_Date', 'Unknown'),
+            'License_Name': license_data.get('Name', 'Unknown')
         })
-
-        logger.info(f"Driver's license data for {sanitized_name} added to data_into_monday.")
-
-        # Check if all required documents are processed and send data to Monday
-        check_and_send_to_monday(sanitized_name)
+        if submitted is not None:
+            license_data['holder_submitted'] = submitted  # This document completed the holder's record
 
         return license_data
 
@@ -287,30 +253,54 @@ def process_drivers_license(image_path, sanitized_name):
 
 
 
- # Function to fetch the sanitized_name from Firestore based on user_id or other identifier
-def fetch_sanitized_name_from_firestore(user_id):
+# Function to fetch the holder key from Firestore based on the Telegram user_id
+def fetch_holder_from_firestore(user_id):
+    """
+    Return (holder_key, sanitized_name) for a Telegram user with a single document read,
+    or (None, None) if the user hasn't uploaded an identity card yet.
+    """
+    from database.firebase_init import initialize_firestore
+
+    # The identity card upload may still be queued for Firestore
+    user_data = pending_document(f"users/{user_id}")
+    if user_data:
+        return user_data.get('holder_key'), user_data.get('sanitized_name')
+
     try:
         # Initialize Firestore database
         db = initialize_firestore()
-        # Assuming you store the sanitized_name under the user's document or another collection
-        doc_ref = db.collection('users').document(user_id)  # Replace 'users' with your collection
-
-        # Fetch the document
-        doc = doc_ref.get()
+        doc = db.collection('users').document(user_id).get()
 
         if doc.exists:
-            # Assuming the sanitized_name is stored in the document fields
-            return doc.to_dict().get('sanitized_name')
+            user_data = doc.to_dict()
+            return user_data.get('holder_key'), user_data.get('sanitized_name')
         else:
             logger.error(f"No document found for user_id: {user_id}")
-            return None
+            return None, None
 
     except Exception as e:
-        logger.error(f"Failed to fetch sanitized_name from Firestore: {e}")
-        return None
+        logger.error(f"Failed to fetch holder from Firestore: {e}")
+        return None, None
+
+
+# Label patterns printed on the driver's license, matched against OCR phrases (Tesseract's
+# words are joined into phrases first, see merge_words)
+DRIVERS_LICENSE_LABELS = {
+    'License_Number': r'Licen[cs]e\s*No\.?',
+    'Name': r'\bName\b',
+    'Birth_Date': r'Birth\s*Date|Birthdate|Date\s*of\s*Birth',
+    'Issue_Date': r'Issue\s*Date',
+}
+
+# License numbers follow the NRIC/FIN format (e.g., "S7120710 B")
+LICENSE_NUMBER_PATTERN = re.compile(r'[STFGM]\d{7}\s?[A-Z]')
+NAME_PATTERN = re.compile(r'[A-Z]+(?:\s+[A-Z]+)+')
 
 
 def extract_drivers_license_data(ocr_result):
+    if not isinstance(ocr_result, OCRResult):
+        ocr_result = OCRResult.from_easyocr(ocr_result)
+
     license_data = {
         'License_Number': None,
         'Name': None,
@@ -318,31 +308,41 @@ def extract_drivers_license_data(ocr_result):
         'Issue_Date': None
     }
 
-    # Iterate through the OCR results to find relevant fields
-    for entry in ocr_result:
-        # Access the detected text from the tuple (entry[1] is the text)
-        text = entry[1].strip()  # entry[1] contains the text in the OCR result
-        
-        # Match the License Number (e.g., "S7120710 B")
-        if re.match(r'[A-Z0-9]{7,}', text):  # Adjust regex to allow 7+ alphanumeric characters
-            license_data['License_Number'] = text
-        
-        # Match the Name (e.g., "CHAN LEONG FEI") - adjust if more specific patterns are needed
-        if re.match(r'[A-Z\s\(\)]+', text) and not license_data['Name']:  # Match uppercase names
-            license_data['Name'] = text
-        
-        # Match the Birth Date (e.g., "Birth Date: 22 Jun 1971" or variations)
-        if 'Birth Date' in text or 'Birthdate' in text or 'Date of Birth' in text:
-            license_data['Birth_Date'] = re.sub(r'(Birth Date:|Birthdate:|Date of Birth:)', '', text).strip()
-        
-        # Match the Issue Date (e.g., "Issue Date: 27 Nov 2003")
-        if 'Issue Date' in text:
-            license_data['Issue_Date'] = text.replace('Issue Date: ', '').strip()
+    # Tesseract reports single words, which the multi-word labels would never match
+    if ocr_result.engine == 'tesseract':
+        ocr_result = merge_words(ocr_result)
+
+    # Match each field by its position relative to its label
+    line_ids, order = group_lines(ocr_result)
+    license_data.update(extract_labelled_fields(ocr_result, DRIVERS_LICENSE_LABELS, line_ids=line_ids))
+
+    # Fall back to the number format when the label was not read
+    if not license_data['License_Number']:
+        for i in order:
+            match = LICENSE_NUMBER_PATTERN.search(ocr_result.texts[i])
+            if match:
+                license_data['License_Number'] = match.group()
+                break
+
+    # Fall back to the first all-uppercase multi-word line in reading order
+    if not license_data['Name']:
+        for i in order:
+            text = ocr_result.texts[i].strip()
+            if NAME_PATTERN.fullmatch(text) and not LICENSE_NUMBER_PATTERN.search(text):
+                license_data['Name'] = text
+                break
 
     return license_data
 
 
-def process_uploaded_document(uploaded_file, document_type, user_id=None, sanitized_name=None):
+def stored_fields(document_data):
+    """
+    A processed document's data as written to Firestore: `holder_submitted` only tells the
+    bot whether this upload completed the holder's record.
+    """
+    return {k: v for k, v in document_data.items() if k != 'holder_submitted'}
+
+def process_uploaded_document(uploaded_file, document_type, user_id=None, holder_key=None):
     """
     This function processes an uploaded document, stores the data in Firestore, 
     and adds the sanitized data to the global dictionary for Monday.com.
@@ -381,73 +381,67 @@ def process_uploaded_document(uploaded_file, document_type, user_id=None, saniti
         # Process the identity card
         if document_type == 'identity_card':
             identity_data = process_identity_card(file_path, user_id)  # Process the identity card
-            if identity_data and 'sanitized_name' in identity_data:
-                sanitized_name = identity_data['sanitized_name']  # Store sanitized name in memory
-                identitycard_name[user_id] = sanitized_name  # Store for future use
+            if identity_data and 'holder_key' in identity_data:
+                holder_key = identity_data['holder_key']  # Store holder key in memory
+                identitycard_name[user_id] = identity_data['sanitized_name']  # Store for future use
             else:
                 logger.error("Failed to extract sanitized name from identity card.")
                 return None
 
         # Process the driver's license
         elif document_type == 'drivers_license':
-            if not sanitized_name:
-                logger.error("Cannot process driver's license without sanitized name.")
+            if not holder_key:
+                logger.error("Cannot process driver's license without holder key.")
                 return None
 
-            # Process the driver's license using the sanitized name
-            drivers_license_data = process_drivers_license(file_path, sanitized_name)
+            # Process the driver's license for the holder
+            drivers_license_data = process_drivers_license(file_path, holder_key)
 
         # Process the log card
         elif document_type == 'log_card':
-            if not sanitized_name:
-                logger.error("Cannot process log card without sanitized name.")
+            if not holder_key:
+                logger.error("Cannot process log card without holder key.")
                 return None
 
-            # Process the log card using the sanitized name
-            log_card_data = process_log_card(file_path, sanitized_name)
+            # Process the log card for the holder
+            log_card_data = process_log_card(file_path, holder_key)
 
         # Check if the result is valid
         if isinstance(identity_data, dict) or isinstance(drivers_license_data, dict) or isinstance(log_card_data, dict):
-            # Combine and sanitize data from all documents and store in the global dictionary
-            sanitized_data = sanitize_and_store_data(
-                user_data=user_id,
+            # Sanitize the data of this document; the process_* functions already merged it into the holder's record
+            sanitized_data = sanitize_document_data(
                 identity_data=identity_data,
                 drivers_license_data=drivers_license_data,
                 log_card_data=log_card_data
             )
-
-            logger.info(f"Sanitized data stored for user {user_id}.")
+            for data in (identity_data, drivers_license_data, log_card_data):
+                if data and 'holder_submitted' in data:
+                    sanitized_data['holder_submitted'] = data['holder_submitted']
 
             # Keep the original Firestore logic intact, saving the document data to Firestore
             # This logic should not be altered to ensure data is still saved in Firestore as intended.
+            # The writes go through the write-behind queue like every other Firestore write
             if document_type == 'identity_card' and identity_data:
                 try:
-                    db = initialize_firestore()
-                    doc_ref = db.collection('policy_holders').document(sanitized_name)
-                    doc_ref.set(identity_data)  # Save identity card data to Firestore
-                    logger.info(f"Identity Card data successfully saved to Firestore under policy_holders/{sanitized_name}.")
+                    with holder_records.lock(holder_key):
+                        get_firestore_writer().set(f"policy_holders/{holder_key}", stored_fields(identity_data))  # Save identity card data to Firestore
+                    logger.info(f"Identity Card data queued for Firestore under policy_holders/{holder_key}.")
                 except Exception as e:
-                    logger.error(f"Failed to save identity card data to Firestore: {e}")
+                    logger.error(f"Failed to queue identity card data for Firestore: {e}")
 
             elif document_type == 'drivers_license' and drivers_license_data:
                 try:
-                    db = initialize_firestore()
-                    doc_ref = db.collection('policy_holders').document(sanitized_name)
-                    subcollection_ref = doc_ref.collection('drivers_license').document()
-                    subcollection_ref.set(drivers_license_data)  # Save driver's license data to Firestore
-                    logger.info(f"Driver's License data successfully saved to Firestore under policy_holders/{sanitized_name}/drivers_license.")
+                    get_firestore_writer().add(f"policy_holders/{holder_key}/drivers_license", stored_fields(drivers_license_data))  # Save driver's license data to Firestore
+                    logger.info(f"Driver's License data queued for Firestore under policy_holders/{holder_key}/drivers_license.")
                 except Exception as e:
-                    logger.error(f"Failed to save driver's license data to Firestore: {e}")
+                    logger.error(f"Failed to queue driver's license data for Firestore: {e}")
 
             elif document_type == 'log_card' and log_card_data:
                 try:
-                    db = initialize_firestore()
-                    doc_ref = db.collection('policy_holders').document(sanitized_name)
-                    subcollection_ref = doc_ref.collection('log_card').document()
-                    subcollection_ref.set(log_card_data)  # Save log card data to Firestore
-                    logger.info(f"Log Card data successfully saved to Firestore under policy_holders/{sanitized_name}/log_card.")
+                    get_firestore_writer().add(f"policy_holders/{holder_key}/log_card", stored_fields(log_card_data))  # Save log card data to Firestore
+                    logger.info(f"Log Card data queued for Firestore under policy_holders/{holder_key}/log_card.")
                 except Exception as e:
-                    logger.error(f"Failed to save log card data to Firestore: {e}")
+                    logger.error(f"Failed to queue log card data for Firestore: {e}")
 
             return sanitized_data  # Return the sanitized data after processing
 
@@ -523,18 +517,27 @@ def parse_extracted_text(extracted_text):
     return parsed_data
 
 
-def process_log_card(image_path, sanitized_name):
-    # Extract text from the saved image using OCR
-    extracted_text = extract_text_from_image(image_path)
+@profile_document('log_card')
+def process_log_card(image_path, holder_key):
+    from firebase_admin import firestore
+
+    # Extract and parse the text, escalating to heavier OCR only if needed
+    parsed_data, ocr_result = run_ocr_cascade(
+        image_path,
+        parse=lambda ocr_result: parse_document('log_card', ocr_result),
+        required_fields=LOG_CARD_REQUIRED_FIELDS,
+        validators=FIELD_VALIDATORS
+    )
     
-    if extracted_text:
-        logger.debug(f"Extracted text from log card: {extracted_text}")  # Log the raw extracted text only in debug
+    if ocr_result:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Extracted text from log card: {ocr_result.text}")  # Log the raw extracted text only in debug
 
-        # Parse the extracted text to structured data
-        parsed_data = parse_log_card_text(extracted_text)
-        
         logger.info(f"Parsed log card data: {parsed_data}")  # Log the parsed data
         
+        # A superseded upload must not overwrite what the newer one writes, nor export its PDF
+        raise_if_cancelled('parse')
+
         # Prepare Firestore document data
         log_card_data = {
             'Vehicle_No': parsed_data.get('Vehicle_No', 'Unknown'),
@@ -552,40 +555,34 @@ def process_log_card(image_path, sanitized_name):
             'PQP_Paid': parsed_data.get('PQP_Paid', None),
             'Intended_Transfer_Date': parsed_data.get('Intended_Transfer_Date', None),
             'timestamp': firestore.SERVER_TIMESTAMP,
-            'image_path': image_path  # Store the image path if needed
+            'image_path': image_path,  # Store the image path if needed
+            'pdf_path': export_searchable_pdf(image_path, ocr_result)
         }
         filtered_log_card_data = {k: v for k, v in log_card_data.items() if v is not None}
 
         try:
-            # Initialize Firestore and reference the user's log_card subcollection
-            db = initialize_firestore()
-            doc_ref = db.collection('policy_holders').document(sanitized_name)
-
-            # Save the log card data in the `log_card` subcollection
-            subcollection_ref = doc_ref.collection('log_card').document()  # Auto-generate a document ID
-            subcollection_ref.set(filtered_log_card_data)
+            # Queue the log card data for the holder's `log_card` subcollection
+            with span('firestore.write', document_type='log_card'):
+                get_firestore_writer().add(f"policy_holders/{holder_key}/log_card", filtered_log_card_data)
 
-            logger.info(f"Log card data successfully saved to Firestore under policy_holders/{sanitized_name}/log_card.")
+            logger.info(f"Log card data queued for Firestore under policy_holders/{holder_key}/log_card.")
 
         except Exception as e:
-            logger.error(f"Failed to save log card data to Firestore: {e}")
+            logger.error(f"Failed to queue log card data for Firestore: {e}")
             return None
 
-        # Update the `data_into_monday` for this user
-        if sanitized_name not in data_into_monday:
-            data_into_monday[sanitized_name] = {}
-
-        data_into_monday[sanitized_name].update({
+        # Merge into the holder's record; the last of the three documents sends it to Monday
+        submitted = holder_records.merge(holder_key, 'log_card', {
             'Vehicle_No': parsed_data.get('Vehicle_No', 'Unknown'),
             'Vehicle_Type': parsed_data.get('Vehicle_Type', 'Unknown'),
             'Make_Model': parsed_data.get('Make_Model', 'Unknown'),
-            'Year_of_Manufacture': parsed_data.get('Year_of_Manufacture', 'Unknown')
+            'Year_of_Manufacture': parsed_data.get('Year_of_Manufacture', 'Unknown'),
+            'Chassis_No': parsed_data.get('Chassis_No', 'Unknown'),
+            'Engine_No': parsed_data.get('Engine_No', 'Unknown'),
+            'Original_Registration_Date': parsed_data.get('Original_Registration_Date', 'Unknown')
         })
-
-        logger.info(f"Log card data for {sanitized_name} added to data_into_monday.")
-
-        # Check if all required documents are processed and send data to Monday
-        check_and_send_to_monday(sanitized_name)
+        if submitted is not None:
+            parsed_data['holder_submitted'] = submitted  # This document completed the holder's record
 
         return parsed_data
 
@@ -685,20 +682,23 @@ def parse_log_card_text(extracted_text):
 
 def get_user_id_from_firestore(name):
     """
-    Function to retrieve the user_id from Firestore using the user's name.
+    Function to retrieve the holder key (policy_holders document ID) from Firestore using
+    the holder's sanitized name. Names aren't unique, this returns the first match.
     """
+    from database.firebase_init import initialize_firestore
+
     # Initialize Firestore database
     db = initialize_firestore()
 
     # Search for the user in Firestore based on their name
     try:
         policy_holders_ref = db.collection('policy_holders')
-        query = policy_holders_ref.where('Name', '==', name).get()
+        query = policy_holders_ref.where('sanitized_name', '==', name).limit(1).get()
 
         # Assuming the query will return only one result; adjust if multiple results are possible
         for doc in query:
             user_data = doc.to_dict()
-            print(f"Found user data: {user_data}")  # Debugging output
+            logger.debug(f"Found user data: {user_data}")  # Debugging output
             return doc.id  # Return the Firestore document ID (this is the user_id)
 
         logger.error(f"User with name {name} not found in Firestore.")
@@ -727,10 +727,6 @@ ENGINE_NUMBER = "engine_number"
 VEHICLE_NO = "text1"
 CHASSIS_NO = "text775"
 
-# Global dictionary to store sanitized data for Monday.com
-data_into_monday = {}
-
-
 MONDAY_API_TOKEN = os.getenv('MONDAY_API_TOKEN')
 POLICY_BOARD_ID = os.getenv('POLICY_BOARD_ID')
 
@@ -740,6 +736,8 @@ def send_data_to_monday(sanitized_data):
     Send the sanitized data to a Monday.com board using the provided column IDs.
     Consolidates data from identity cards, driver's licenses, and log cards into one request.
     """
+    import requests
+
     if not POLICY_BOARD_ID:
         logger.error("POLICY_BOARD_ID not set. Cannot send data to Monday.com.")
         return False
@@ -795,7 +793,8 @@ def send_data_to_monday(sanitized_data):
 
     # Send the request to Monday.com API
     try:
-        response = requests.post(monday_api_url, json={'query': query}, headers=headers)
+        with span('monday.create_item'):
+            response = requests.post(monday_api_url, json={'query': query}, headers=headers)
 
         # Check the response status
         if response.status_code == 200:
@@ -813,15 +812,16 @@ def send_data_to_monday(sanitized_data):
 
 
 
-def sanitize_and_store_data(user_data, identity_data=None, drivers_license_data=None, log_card_data=None):
+def sanitize_document_data(identity_data=None, drivers_license_data=None, log_card_data=None):
     """
-    Sanitize and store data from different document types (identity card, driver's license, log card).
+    Sanitize data from different document types (identity card, driver's license, log card).
     """
     sanitized_data = {}
 
     if identity_data:
         sanitized_data.update({
             "sanitized_name": identity_data.get('sanitized_name', 'Unknown'),
+            "holder_key": identity_data.get('holder_key'),
             "Identity_Card_No": identity_data.get('Identity_Card_No', 'Unknown'),
             "Race": identity_data.get('Race', 'Unknown'),
             "Date_of_birth": identity_data.get('Date_of_birth', 'Unknown'),
@@ -844,88 +844,24 @@ def sanitize_and_store_data(user_data, identity_data=None, drivers_license_data=
             # Add more fields as needed
         })
 
-    # Store sanitized data in the global dictionary
-    data_into_monday[user_data] = sanitized_data
-    logger.info(f"Sanitized data for user {user_data} stored in the global dictionary.")
-
-    # Step 4: Send the sanitized data to Monday.com board
-    result = send_data_to_monday(sanitized_data)
-
-    if result:
-        logger.info(f"Sanitized data for {user_data} successfully sent to Monday.com.")
-    else:
-        logger.error(f"Failed to send sanitized data for {user_data} to Monday.com.")
-
     return sanitized_data
 
 
-def check_and_send_to_monday(sanitized_name):
+def send_completed_holder_to_monday(holder_key, holder_data):
     """
-    Check if all documents (identity card, driver's license, log card) have been processed for the user.
-    If so, send the consolidated data to Monday.com.
+    Completion handler of the holder records: called once per holder, after their
+    identity card, driver's license and log card have all been processed. Returns
+    whether Monday.com took the data; if not, the holder's next upload tries again.
     """
-    user_data = data_into_monday.get(sanitized_name, {})
-
-    # Check if all required fields from all documents are available
-    if all(key in user_data for key in ['Identity_Card_No', 'License_Number', 'Vehicle_No']):
-        logger.info(f"All data ready for {sanitized_name}. Sending to Monday.com.")
-        
-        # Call the function to sanitize and send data to Monday
-        sanitize_and_store_data(sanitized_name, identity_data=user_data)
+    logger.info(f"All data ready for {holder_key}. Sending to Monday.com.")
 
-        # Optionally clear the data for this user after sending
-        del data_into_monday[sanitized_name]
-    else:
-        logger.info(f"Waiting for more data for {sanitized_name}. Not all documents have been processed yet.")
-
-
-
-
-# Modify the /upload_document route to handle log card processing
-@app.route('/upload_document', methods=['POST'])
-def upload_document():
-    if 'file' not in request.files:
-        return 'No file part', 400
-
-    file = request.files['file']
-    document_type = request.form.get('document_type', 'identity_card')  # Default to identity card if not specified
-    sanitized_name = request.form.get('sanitized_name')  # Retrieve sanitized_name from the form
-
-    if file.filename == '':
-        return 'No selected file', 400
-
-    if file:
-        extracted_data = process_uploaded_document(file, document_type, sanitized_name)
-        
-        if extracted_data:
-            if document_type == 'identity_card':
-                # Store sanitized_name for subsequent uploads (driver's license, log card)
-                sanitized_name = extracted_data.get('sanitized_name')
-
-                # Ask for driver's license next
-                return {
-                    'message': 'Identity card processed. Please upload the driver\'s license.',
-                    'sanitized_name': sanitized_name  # Pass sanitized_name back to the client
-                }, 200
-
-            elif document_type == 'drivers_license':
-                return {
-                    'message': 'Driver\'s license processed. Please upload the log card.',
-                    'sanitized_name': sanitized_name  # Pass sanitized_name back to the client
-                }, 200
-
-            elif document_type == 'log_card':
-                return {
-                    'message': 'Log card processed successfully!',
-                    'extracted_data': extracted_data
-                }, 200
-        else:
-            return 'Failed to process image', 500
+    if send_data_to_monday(holder_data):
+        logger.info(f"Data for {holder_key} successfully sent to Monday.com.")
+        return True
 
+    logger.error(f"Failed to send data for {holder_key} to Monday.com.")
+    return False
 
-if __name__ == '__main__':
-    app.run(debug=True)
-    
-    
-    
 
+# Per-holder records of the fields read so far, sent to Monday.com once all documents are in
+holder_records = HolderAggregator(on_complete=send_completed_holder_to_monday)
@@ -0,0 +1,453 @@
+import os
+import re
+import time
+import queue
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from models.image_processing import enhance_image, to_source_pixels
+from models.image_buffers import trim_scratch_buffers
+from models.cancellation import current_token, raise_if_cancelled
+from models.tracing import activate, span, current_context
+from models.documents import split_document_pages, remove_page_files
+from models.concurrency import available_cores, current_job_threads
+
+logger = logging.getLogger(__name__)
+
+# Minimum confidence (0-1) a required field needs before the cascade stops escalating
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', '0.6'))
+
+# (engine, enhancement profile) stages, cheapest first. Tesseract gets a deskewed, binarized
+# image at native resolution; the 2x 'full' profile remains available for custom cascades
+OCR_CASCADE = (
+    ('tesseract', 'fast'),
+    ('tesseract', 'binarize'),
+    ('easyocr', 'fast'),
+)
+
+# Page threads of this process. A job uses as many of them as its thread budget allows
+# (see current_job_threads()), so a lone upload spreads its pages over the cores
+OCR_PAGE_WORKERS = int(os.getenv('OCR_PAGE_WORKERS', '0')) or available_cores()
+
+# Path to the Tesseract executable
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', '/opt/homebrew/bin/tesseract')
+
+# Tesseract page segmentation mode and resolution hint. Arrays carry no DPI, and without a
+# hint Tesseract guesses 70 and sizes its text heuristics wrongly
+TESSERACT_PSM = int(os.getenv('TESSERACT_PSM', '3'))
+TESSERACT_DPI = int(os.getenv('TESSERACT_DPI', '300'))
+TESSERACT_CONFIG = f"--psm {TESSERACT_PSM} --dpi {TESSERACT_DPI}"
+
+# Inference backend for EasyOCR: 'torch' (default), 'onnx' or 'onnx-int8' (dynamically quantized)
+EASYOCR_BACKEND = os.getenv('EASYOCR_BACKEND', 'torch')
+
+# EasyOCR recognizer batch size and data loader threads
+EASYOCR_BATCH_SIZE = int(os.getenv('EASYOCR_BATCH_SIZE', '8'))
+EASYOCR_WORKERS = int(os.getenv('EASYOCR_WORKERS', '0'))
+
+# Concurrent EasyOCR requests are collected for up to this long, or this many images, and run as one batch.
+# OCR_BATCH_MAX_ITEMS=1 disables micro-batching
+OCR_BATCH_WINDOW_MS = float(os.getenv('OCR_BATCH_WINDOW_MS', '5'))
+OCR_BATCH_MAX_ITEMS = int(os.getenv('OCR_BATCH_MAX_ITEMS', '8'))
+
+# Engines are imported and initialized on first use (or by models.warm_up), not at import time.
+# The EasyOCR reader loads its models once and is reused for every upload
+_easyocr_reader = None
+_easyocr_batcher = None
+_tesseract = None
+
+# Tesseract runs as a subprocess and OpenCV/torch release the GIL, so pages parallelize on threads
+_page_executor = None
+
+
+class OCRResult:
+    """
+    Output of one OCR engine run. Boxes are packed into a single float32 array of
+    shape (n, 4, 2) with texts and confidences parallel to it; `text` holds the
+    words joined back into lines for the regex parsers.
+    """
+    __slots__ = ('engine', 'boxes', 'texts', 'confidences', 'text')
+
+    def __init__(self, engine, boxes, texts, confidences, text):
+        self.engine = engine
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+        self.texts = list(texts)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self.text = text
+
+    @classmethod
+    def from_easyocr(cls, result):
+        texts = [entry[1] for entry in result]
+        return cls(
+            'easyocr',
+            [entry[0] for entry in result],
+            texts,
+            [entry[2] for entry in result],
+            "\n".join(texts)
+        )
+
+    @classmethod
+    def merge(cls, results):
+        """
+        Combine per-page results into one, in page order. Boxes of each page are shifted
+        below the previous page so the geometry stays unambiguous.
+        """
+        if len(results) == 1:
+            return results[0]
+
+        boxes = []
+        offset = 0.0
+        for result in results:
+            page_boxes = result.boxes.copy()
+            page_boxes[:, :, 1] += offset
+            boxes.append(page_boxes)
+            if len(result):
+                offset = float(page_boxes[:, :, 1].max()) + 1
+
+        return cls(
+            results[0].engine,
+            np.concatenate(boxes),
+            [text for result in results for text in result.texts],
+            np.concatenate([result.confidences for result in results]),
+            "\n".join(result.text for result in results)
+        )
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        # Yield EasyOCR-style (bbox, text, confidence) tuples for code written against readtext output
+        for i, text in enumerate(self.texts):
+            yield self.boxes[i], text, float(self.confidences[i])
+
+
+def get_easyocr_reader():
+    global _easyocr_reader
+    if _easyocr_reader is None:
+        import easyocr  # Pulls in torch, only paid by processes that actually run EasyOCR
+
+        if EASYOCR_BACKEND in ('onnx', 'onnx-int8'):
+            from models.onnx_backend import use_onnx_backend
+
+            # EasyOCR's own torch quantization leaves models torch.onnx can't export; the
+            # int8 variant is quantized by ONNX Runtime instead
+            reader = easyocr.Reader(['en'], quantize=False)
+            try:
+                use_onnx_backend(reader, quantize=EASYOCR_BACKEND == 'onnx-int8')
+            except Exception as e:
+                logger.warning(f"EasyOCR {EASYOCR_BACKEND} backend unavailable ({e}), using torch.")
+                reader = easyocr.Reader(['en'])
+        else:
+            if EASYOCR_BACKEND != 'torch':
+                logger.warning(f"Unknown EASYOCR_BACKEND '{EASYOCR_BACKEND}', using torch.")
+            reader = easyocr.Reader(['en'])
+
+        _easyocr_reader = reader
+    return _easyocr_reader
+
+
+def get_tesseract():
+    global _tesseract
+    if _tesseract is None:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+        _tesseract = pytesseract
+    return _tesseract
+
+
+def run_tesseract(image):
+    """
+    Run Tesseract on an image and return an OCRResult with one entry per word.
+    """
+    import cv2
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    pytesseract = get_tesseract()
+    data = pytesseract.image_to_data(image, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+
+    boxes = []
+    words = []
+    confidences = []
+    lines = []
+    current_line = None
+    for i, word in enumerate(data['text']):
+        confidence = float(data['conf'][i])
+        if not word.strip() or confidence < 0:
+            continue
+
+        x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
+        boxes.append([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+        words.append(word)
+        confidences.append(confidence / 100)  # Tesseract reports confidence as 0-100
+
+        # Rebuild the line layout that image_to_string would have produced
+        line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        if line_key != current_line:
+            lines.append([])
+            current_line = line_key
+        lines[-1].append(word)
+
+    text = "\n".join(" ".join(line) for line in lines)
+    return OCRResult('tesseract', boxes, words, confidences, text)
+
+
+def readtext_batch(images):
+    """
+    Run EasyOCR detection and recognition over several images in one call. Images are
+    converted to grayscale and padded to a common size with white, so box coordinates
+    stay those of each original image. Returns one readtext-style result per image.
+    """
+    import cv2
+
+    reader = get_easyocr_reader()
+    images = [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image for image in images]
+
+    if len(images) == 1:
+        return [reader.readtext(images[0], batch_size=EASYOCR_BATCH_SIZE, workers=EASYOCR_WORKERS)]
+
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    padded = np.full((len(images), height, width), 255, dtype=np.uint8)
+    for i, image in enumerate(images):
+        padded[i, :image.shape[0], :image.shape[1]] = image
+
+    return reader.readtext_batched(list(padded), batch_size=EASYOCR_BATCH_SIZE, workers=EASYOCR_WORKERS)
+
+
+class EasyOCRBatcher:
+    """
+    Collects EasyOCR requests from concurrent uploads for up to OCR_BATCH_WINDOW_MS (or
+    OCR_BATCH_MAX_ITEMS images), runs them through readtext_batch on a single background
+    thread, and resolves each caller's Future with its own result.
+    """
+
+    def __init__(self, max_items=OCR_BATCH_MAX_ITEMS, window_ms=OCR_BATCH_WINDOW_MS):
+        self.max_items = max_items
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='easyocr-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = readtext_batch([image for image, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            logger.debug(f"EasyOCR batch of {len(batch)} image(s) recognized.")
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+def get_easyocr_batcher():
+    global _easyocr_batcher
+    if _easyocr_batcher is None:
+        _easyocr_batcher = EasyOCRBatcher()
+    return _easyocr_batcher
+
+
+def run_easyocr(image):
+    """
+    Run EasyOCR on an image and return an OCRResult with one entry per detected text box.
+    The image is micro-batched with other uploads being OCR'd at the same time.
+    """
+    if OCR_BATCH_MAX_ITEMS <= 1:
+        return OCRResult.from_easyocr(readtext_batch([image])[0])
+    return OCRResult.from_easyocr(get_easyocr_batcher().submit(image).result())
+
+
+OCR_ENGINES = {
+    'tesseract': run_tesseract,
+    'easyocr': run_easyocr,
+}
+
+
+def get_page_executor():
+    global _page_executor
+    if _page_executor is None:
+        _page_executor = ThreadPoolExecutor(max_workers=OCR_PAGE_WORKERS, thread_name_prefix='ocr-page')
+    return _page_executor
+
+
+def ocr_page(page, engine, profile, cancel_token=None, trace_context=None, tile_threads=None):
+    """
+    OCR one decoded grayscale page. Returns None if enhancement failed.
+    """
+    with activate(trace_context):
+        try:
+            # Scratch buffers will do: the engine is done with the image before this thread enhances again
+            with span('enhance', profile=profile):
+                image, transform = enhance_image(page, profile=profile, return_transform=True, reuse_buffers=True,
+                                                tile_threads=tile_threads)
+        except Exception as e:
+            logger.error(f"Error enhancing image quality: {e}")
+            return None
+
+        # Don't start OCR for a job that was superseded while enhancing
+        raise_if_cancelled('enhance', cancel_token)
+
+        with span('ocr', engine=engine, profile=profile):
+            result = OCR_ENGINES[engine](image)
+
+    # Report boxes in source image pixels whatever the enhancement profile scaled or rotated to
+    if len(result) and not np.array_equal(transform, np.eye(2, 3)):
+        result.boxes = to_source_pixels(result.boxes, transform)
+    return result
+
+
+def ocr_pages(pages, engine, profile):
+    """
+    OCR every page of a document with one engine/profile, in parallel when there is more
+    than one page, and merge the pages into a single OCRResult (None if no page loaded).
+    """
+    # Page threads can't see the job's cancel token or trace, so hand them over
+    cancel_token = current_token()
+    trace_context = current_context()
+
+    # Split the job's thread budget: as many pages at once as it covers, and the rest of it
+    # to each page's enhancement tiles
+    threads = current_job_threads()
+    page_threads = max(1, min(len(pages), threads, OCR_PAGE_WORKERS))
+    tile_threads = max(1, threads // page_threads)
+    if page_threads == 1:
+        results = [ocr_page(page, engine, profile, cancel_token, trace_context, tile_threads) for page in pages]
+    else:
+        # Each page runs in a copy of this context, so context variables (the memory profile's
+        # document type) carry over too
+        results = []
+        for start in range(0, len(pages), page_threads):
+            futures = [
+                get_page_executor().submit(contextvars.copy_context().run, ocr_page, page, engine, profile,
+                                           cancel_token, trace_context, tile_threads)
+                for page in pages[start:start + page_threads]
+            ]
+            results.extend(future.result() for future in futures)
+
+    results = [result for result in results if result is not None]
+    if not results:
+        return None
+    return OCRResult.merge(results)
+
+
+def field_confidence(value, ocr_result):
+    """
+    Confidence of a parsed field value: the weakest of its words, each scored by the
+    best OCR entry containing it as a whole word, so a short value like "M" doesn't take
+    the confidence of "MALE" or "MOTOR". Values that cannot be traced back score 0.
+    """
+    tokens = str(value).split()
+    if not tokens:
+        return 0.0
+
+    scores = []
+    for token in tokens:
+        word = re.compile(r'(?<![A-Za-z0-9])' + re.escape(token) + r'(?![A-Za-z0-9])')
+        matches = [i for i, text in enumerate(ocr_result.texts) if word.search(text)]
+        scores.append(float(ocr_result.confidences[matches].max()) if matches else 0.0)
+    return min(scores)
+
+
+def read_verbatim(value, ocr_result):
+    """
+    Whether `value` is in the OCR text exactly as read (ignoring spaces and case), rather
+    than something parse() corrected it to.
+    """
+    compact = lambda text: ''.join(str(text).split()).upper()
+    return compact(value) in compact(ocr_result.text)
+
+
+def run_ocr_cascade(image_path, parse, required_fields, cascade=OCR_CASCADE, validators=None):
+    """
+    Run the OCR stages in `cascade` order and stop as soon as every required field was
+    parsed with at least OCR_MIN_CONFIDENCE. A heavier stage only replaces fields that
+    are still missing or below the threshold. Multi-page uploads (PDF, TIFF) are OCR'd
+    page-parallel and parsed as one text.
+
+    `parse` is called with the stage's OCRResult and returns a dict of fields.
+    `validators` maps fields to checksum predicates (see models.validation); a value
+    read as is that passes is trusted outright, since OCR noise essentially never yields
+    a valid checksum. A value parse() corrected is scored like any other, so a heavier
+    stage still gets to read it.
+    Returns (parsed_data, ocr_result) for the last stage run, or (None, None) if no
+    stage extracted any text.
+    """
+    import cv2
+
+    parsed_data = {}
+    confidences = {}
+    ocr_result = None
+
+    # Decode every page once, as grayscale; all stages read the same pixels. The page threads
+    # share this process's memory, so plain arrays will do
+    with span('decode'):
+        page_paths = split_document_pages(image_path)
+        try:
+            pages = [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in page_paths]
+        finally:
+            remove_page_files(image_path, page_paths)  # The pixels are in memory now
+        pages = [page for page in pages if page is not None]
+    if not pages:
+        logger.error(f"Image at {image_path} could not be loaded. Check file path or integrity.")
+        return None, None
+
+    try:
+        for engine, profile in cascade:
+            stage_result = ocr_pages(pages, engine, profile)
+            raise_if_cancelled('ocr')
+            if stage_result is None:
+                continue
+
+            if not stage_result.text.strip():
+                logger.info(f"OCR stage {engine}/{profile} extracted no text from {image_path}.")
+                continue
+            ocr_result = stage_result
+
+            with span('parse', engine=engine, profile=profile):
+                stage_fields = parse(stage_result)
+
+            for field, value in stage_fields.items():
+                if (value and validators and field in validators and validators[field](value)
+                        and read_verbatim(value, stage_result)):
+                    confidence = 1.0
+                else:
+                    confidence = field_confidence(value, stage_result) if value else 0.0
+                if field not in parsed_data or (confidences[field] < OCR_MIN_CONFIDENCE and confidence > confidences[field]):
+                    parsed_data[field] = value
+                    confidences[field] = confidence
+
+            low_confidence = [field for field in required_fields if confidences.get(field, 0.0) < OCR_MIN_CONFIDENCE]
+            if not low_confidence:
+                logger.info(f"OCR stage {engine}/{profile} read all required fields of {image_path}.")
+                break
+
+            logger.info(f"OCR stage {engine}/{profile} left low-confidence fields {low_confidence}, escalating.")
+    finally:
+        trim_scratch_buffers()
+
+    if ocr_result is None:
+        return None, None
+
+    return parsed_data, ocr_result
@@ -0,0 +1,147 @@
+import re
+import numpy as np
+
+# A box joins the current line when its vertical centre is within this fraction of the median box height
+LINE_MERGE_RATIO = 0.5
+
+# How far below a label (in median box heights) its value may be printed
+BELOW_SEARCH_RATIO = 2.5
+
+# Words on one line are joined into a phrase while the gap between them is at most this
+# many median box heights; wider gaps separate a label from its value, or two columns
+WORD_GAP_RATIO = 1.0
+
+
+def box_geometry(ocr_result):
+    """
+    Return (left, top, right, bottom) arrays for all boxes of an OCRResult at once.
+    """
+    xs = ocr_result.boxes[:, :, 0]
+    ys = ocr_result.boxes[:, :, 1]
+    return xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)
+
+
+def median_box_height(ocr_result):
+    if len(ocr_result) == 0:
+        return 1.0
+    _, top, _, bottom = box_geometry(ocr_result)
+    return max(float(np.median(bottom - top)), 1.0)
+
+
+def group_lines(ocr_result):
+    """
+    Assign every box a line number. Boxes are sorted by vertical centre and a new line
+    starts wherever the gap to the previous centre exceeds LINE_MERGE_RATIO of the
+    median box height. Returns (line_ids, order), where order lists the box indices in
+    reading order (top to bottom, then left to right).
+    """
+    if len(ocr_result) == 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.intp)
+
+    left, top, _, bottom = box_geometry(ocr_result)
+    centre_y = (top + bottom) / 2
+
+    by_y = np.argsort(centre_y, kind='stable')
+    breaks = np.diff(centre_y[by_y]) > LINE_MERGE_RATIO * median_box_height(ocr_result)
+
+    line_ids = np.empty(len(ocr_result), dtype=np.int32)
+    line_ids[by_y] = np.concatenate(([0], np.cumsum(breaks)))
+    order = np.lexsort((left, line_ids))
+    return line_ids, order
+
+
+def merge_words(ocr_result, line_ids=None):
+    """
+    Join the words of an OCRResult with one box per word (Tesseract) into phrases: runs of
+    words on the same line with no wide gap between them. A phrase's box spans its words
+    and its confidence is their lowest, so labels of several words ("Birth Date") match
+    one box, as they do in EasyOCR's output. Returns a new OCRResult.
+    """
+    if len(ocr_result) == 0:
+        return ocr_result
+
+    if line_ids is None:
+        line_ids, order = group_lines(ocr_result)
+    else:
+        order = np.lexsort((box_geometry(ocr_result)[0], line_ids))
+    left, top, right, bottom = box_geometry(ocr_result)
+    max_gap = WORD_GAP_RATIO * median_box_height(ocr_result)
+
+    phrases = []  # Lists of box indices
+    for i in order:
+        previous = phrases[-1][-1] if phrases else None
+        if previous is not None and line_ids[i] == line_ids[previous] and left[i] - right[previous] <= max_gap:
+            phrases[-1].append(i)
+        else:
+            phrases.append([i])
+
+    boxes = []
+    for phrase in phrases:
+        x0, y0, x1, y1 = left[phrase].min(), top[phrase].min(), right[phrase].max(), bottom[phrase].max()
+        boxes.append([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+
+    return type(ocr_result)(
+        ocr_result.engine,
+        boxes,
+        [' '.join(ocr_result.texts[i] for i in phrase) for phrase in phrases],
+        [ocr_result.confidences[phrase].min() for phrase in phrases],
+        ocr_result.text
+    )
+
+
+def extract_labelled_fields(ocr_result, labels, line_ids=None):
+    """
+    Find the value printed next to each label. `labels` maps a field name to a regex
+    for its label. A value is the rest of the label's own box ("Issue Date: 27 Nov 2003"),
+    else the nearest non-label box to its right on the same line, else the nearest
+    non-label box below it that overlaps it horizontally.
+    Returns a dict with only the fields whose label was found.
+    """
+    if len(ocr_result) == 0:
+        return {}
+
+    if line_ids is None:
+        line_ids, _ = group_lines(ocr_result)
+
+    left, top, right, bottom = box_geometry(ocr_result)
+    height = median_box_height(ocr_result)
+    patterns = {field: re.compile(pattern, re.IGNORECASE) for field, pattern in labels.items()}
+
+    # Boxes holding nothing but a label can never be another label's value
+    label_matches = {field: [pattern.search(text) for text in ocr_result.texts] for field, pattern in patterns.items()}
+    is_label = np.zeros(len(ocr_result), dtype=bool)
+    for matches in label_matches.values():
+        for i, match in enumerate(matches):
+            if match and not ocr_result.texts[i][match.end():].strip(' :.-'):
+                is_label[i] = True
+
+    fields = {}
+    for field, matches in label_matches.items():
+        for i, match in enumerate(matches):
+            if not match:
+                continue
+
+            remainder = ocr_result.texts[i][match.end():].strip(' :.-')
+            if remainder:
+                fields[field] = remainder
+                break
+
+            candidates = ~is_label
+            candidates[i] = False
+
+            # Nearest box to the right on the same line
+            right_of = candidates & (line_ids == line_ids[i]) & (left >= right[i] - height)
+            if right_of.any():
+                distance = np.where(right_of, left - right[i], np.inf)
+                fields[field] = ocr_result.texts[int(np.argmin(distance))].strip()
+                break
+
+            # Nearest box underneath that overlaps the label horizontally
+            gap = top - bottom[i]
+            below = candidates & (gap >= -height / 2) & (gap <= BELOW_SEARCH_RATIO * height) & (left < right[i]) & (right > left[i])
+            if below.any():
+                distance = np.where(below, gap, np.inf)
+                fields[field] = ocr_result.texts[int(np.argmin(distance))].strip()
+                break
+
+    return fields
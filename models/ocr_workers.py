@@ -0,0 +1,151 @@
+import os
+import zlib
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from models.cancellation import cancellable
+from models.concurrency import job_threads
+from models.tracing import activate, span
+from models import memory_profile
+
+logger = logging.getLogger(__name__)
+
+# Number of OCR worker processes. 0 keeps OCR inside the bot process, on a thread so the
+# event loop is not blocked; N > 0 hands every upload to one of N separate processes
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '0'))
+
+# Warm a worker up (engines loaded, a synthetic card of each type OCR'd) when it starts
+# instead of on its first upload
+OCR_WORKER_WARM_UP = os.getenv('OCR_WORKER_WARM_UP', 'true').lower() == 'true'
+
+_worker_pools = None
+_manager = None  # Serves the cancel tokens shared with worker processes
+
+
+def _init_worker():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    if memory_profile.profiling_requested():
+        memory_profile.enable()
+
+    # Inherited from the bot process's environment, unless the worker was started some other way
+    from models.concurrency import pin_library_threads
+    pin_library_threads()
+
+    if OCR_WORKER_WARM_UP:
+        from models.warm_up import warm_up
+        warm_up()
+
+
+def run_document_job(document_type, image_path, user_id=None, holder_key=None, cancel_token=None, trace_context=None,
+                     threads=None):
+    """
+    Process one uploaded document. Runs inside an OCR worker (or a thread of the bot
+    process) and returns the extracted data as plain values that pickle cheaply.
+    Raises JobCancelled at the next stage boundary once `cancel_token` is set. Spans are
+    recorded under `trace_context`, the caller's current_context(). `threads` is the job's
+    budget for page- and tile-parallel work (see current_job_threads()).
+    """
+    from models.model import process_identity_card, process_uploaded_document
+
+    with activate(trace_context), span('ocr_job', document_type=document_type), cancellable(cancel_token), job_threads(threads):
+        if document_type == 'identity_card':
+            extracted_data = process_identity_card(image_path, user_id=user_id)
+        else:
+            extracted_data = process_uploaded_document(image_path, document_type=document_type, holder_key=holder_key)
+
+    if not extracted_data:
+        return None
+
+    # The Firestore timestamp sentinel is only meaningful to the worker that wrote it
+    return {k: v for k, v in extracted_data.items() if k != 'timestamp'}
+
+
+def _warm_up_job():
+    from models.warm_up import warm_up
+
+    return warm_up()
+
+
+def warm_up_workers():
+    """
+    Warm up wherever uploads will be OCR'd: every worker process, started now and in
+    parallel, or this process when OCR_WORKERS is 0. Returns each component's warm-up
+    seconds, the slowest worker's where there are several.
+    """
+    if OCR_WORKERS <= 0:
+        return _warm_up_job()
+
+    durations = {}
+    for future in [pool.submit(_warm_up_job) for pool in get_worker_pools()]:
+        for component, seconds in future.result().items():
+            durations[component] = max(seconds, durations.get(component, 0.0))
+    return durations
+
+
+def get_worker_pools():
+    global _worker_pools, _manager
+    if _worker_pools is None:
+        context = multiprocessing.get_context('spawn')  # Never fork a process that runs an event loop
+        _manager = context.Manager()
+        _worker_pools = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker)
+            for _ in range(OCR_WORKERS)
+        ]
+        logger.info(f"Started {OCR_WORKERS} OCR worker process(es).")
+    return _worker_pools
+
+
+def get_worker_for(user_id):
+    """
+    Pick the worker for a user. Uploads of one user always go to the same worker, so the
+    per-holder data it accumulates between documents stays in one process. This assumes
+    each holder's documents come from a single Telegram user, as the conversation does:
+    the identity card has no holder key to route by until it is read, and the later
+    documents find their holder through the user who sent it.
+    """
+    if OCR_WORKERS <= 0:
+        return None  # The event loop's default thread pool
+
+    pools = get_worker_pools()
+    return pools[zlib.crc32(str(user_id).encode()) % len(pools)]
+
+
+def new_cancel_token():
+    """
+    A fresh Event for cancelling one job. Jobs in worker processes get a manager Event,
+    so setting it in the bot process is seen by the worker.
+    """
+    if OCR_WORKERS <= 0:
+        return threading.Event()
+    get_worker_pools()
+    return _manager.Event()
+
+
+async def process_document(document_type, image_path, user_id=None, holder_key=None, cancel_token=None,
+                           trace_context=None, threads=None):
+    """
+    Hand an uploaded document to its OCR worker and wait for the extracted data without
+    blocking the bot's event loop. Only the image path crosses the process boundary.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_worker_for(user_id), run_document_job,
+        document_type, image_path, user_id, holder_key, cancel_token, trace_context, threads
+    )
+
+
+def shutdown_workers():
+    global _worker_pools, _manager
+    if _worker_pools:
+        for pool in _worker_pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+        _worker_pools = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
@@ -0,0 +1,129 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Where exported (and quantized) EasyOCR models are cached between runs
+EASYOCR_ONNX_DIR = os.getenv('EASYOCR_ONNX_DIR', os.path.join(os.path.expanduser('~'), '.EasyOCR', 'onnx'))
+
+ONNX_OPSET = 13
+
+
+class OnnxModule:
+    """
+    Stands in for one of EasyOCR's torch models. EasyOCR keeps doing its own pre- and
+    post-processing with torch tensors; only the forward pass runs in ONNX Runtime.
+    """
+
+    def __init__(self, session, returns_tuple=False):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.returns_tuple = returns_tuple
+
+    def eval(self):
+        return self
+
+    def __call__(self, x, *args):
+        import torch
+
+        outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        outputs = [torch.from_numpy(output) for output in outputs]
+        return tuple(outputs) if self.returns_tuple else outputs[0]
+
+
+def _export_detector(model, path):
+    import torch
+
+    dummy = torch.randn(1, 3, 640, 640)
+    torch.onnx.export(
+        model, dummy, path,
+        input_names=['input'], output_names=['score', 'feature'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                      'score': {0: 'batch', 1: 'height', 2: 'width'},
+                      'feature': {0: 'batch', 2: 'height', 3: 'width'}},
+        opset_version=ONNX_OPSET
+    )
+
+
+def _export_recognizer(model, path, image_height):
+    import torch
+
+    class RecognizerExport(torch.nn.Module):
+        # The CRNN forward() takes a `text` argument it never uses
+        def __init__(self, recognizer):
+            super().__init__()
+            self.recognizer = recognizer
+
+        def forward(self, x):
+            return self.recognizer(x, None)
+
+    dummy = torch.randn(1, 1, image_height, 256)
+    torch.onnx.export(
+        RecognizerExport(model), dummy, path,
+        input_names=['input'], output_names=['preds'],
+        dynamic_axes={'input': {0: 'batch', 3: 'width'}, 'preds': {0: 'batch', 1: 'steps'}},
+        opset_version=ONNX_OPSET
+    )
+
+
+def _model_path(name, quantize):
+    return os.path.join(EASYOCR_ONNX_DIR, f"{name}.int8.onnx" if quantize else f"{name}.onnx")
+
+
+def export_models(reader, quantize=False):
+    """
+    Export the reader's CRAFT detector and CRNN recognizer to ONNX, plus int8 dynamically
+    quantized copies when `quantize` is set. Existing files are reused.
+    Returns (detector_path, recognizer_path).
+    """
+    os.makedirs(EASYOCR_ONNX_DIR, exist_ok=True)
+
+    detector = getattr(reader.detector, 'module', reader.detector).eval()
+    recognizer = getattr(reader.recognizer, 'module', reader.recognizer).eval()
+
+    exports = (
+        ('detector', lambda path: _export_detector(detector, path)),
+        ('recognizer', lambda path: _export_recognizer(recognizer, path, reader.imgH)),
+    )
+
+    paths = []
+    for name, export in exports:
+        path = _model_path(name, quantize=False)
+        if not os.path.exists(path):
+            logger.info(f"Exporting EasyOCR {name} to {path}")
+            export(path)
+
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            quantized_path = _model_path(name, quantize=True)
+            if not os.path.exists(quantized_path):
+                logger.info(f"Quantizing EasyOCR {name} to {quantized_path}")
+                quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+            path = quantized_path
+
+        paths.append(path)
+
+    return tuple(paths)
+
+
+def use_onnx_backend(reader, quantize=False):
+    """
+    Swap the reader's torch models for ONNX Runtime sessions. The torch models are dropped
+    afterwards so their weights can be freed. If exporting or loading fails, the reader is
+    left on torch untouched and the error raised.
+    """
+    import onnxruntime
+
+    detector_path, recognizer_path = export_models(reader, quantize=quantize)
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    providers = ['CPUExecutionProvider']
+
+    detector = OnnxModule(onnxruntime.InferenceSession(detector_path, options, providers=providers), returns_tuple=True)
+    recognizer = OnnxModule(onnxruntime.InferenceSession(recognizer_path, options, providers=providers))
+    reader.detector, reader.recognizer = detector, recognizer
+
+    logger.info(f"EasyOCR running on ONNX Runtime ({'int8' if quantize else 'fp32'}).")
+    return reader
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import logging
+from models.ocr_layout import box_geometry
+from models.tracing import span
+from models.documents import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# Save every uploaded image as a searchable PDF (the image with its OCR text invisibly on top)
+# in PDF_FOLDER, and record its path with the document in Firestore
+PDF_EXPORT = os.getenv('PDF_EXPORT', 'false').lower() == 'true'
+
+# Folder generated PDFs are stored in, created on first use
+PDF_FOLDER = os.path.join(os.getcwd(), 'pdf_folder')
+
+# Path to the DejaVuSansCondensed.ttf file
+FONT_PATH = os.getenv('FONT_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts', 'DejaVuSansCondensed.ttf'))
+
+# Page images are re-encoded as JPEG no wider than this before being embedded
+PDF_IMAGE_MAX_WIDTH = int(os.getenv('PDF_IMAGE_MAX_WIDTH', '1600'))
+PDF_IMAGE_JPEG_QUALITY = int(os.getenv('PDF_IMAGE_JPEG_QUALITY', '80'))
+
+# Placement of the image on the page, in mm
+PDF_IMAGE_X = 10
+PDF_IMAGE_Y = 10
+PDF_IMAGE_WIDTH = 190
+
+def new_utf8_pdf():
+    """
+    A new PDF with DejaVuSansCondensed loaded, for Unicode text. Needs fpdf2 2.7 or later.
+    Each PDF adds the font itself: the font object records the glyphs its document uses
+    for subsetting, so it can't be shared (see benchmarks/pdf_font.py for the cost).
+    """
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_font('DejaVu', '', FONT_PATH)
+    return pdf
+
+def add_invisible_text_layer(pdf, ocr_result, scale):
+    """
+    Write each OCR entry as invisible text (PDF text render mode 3) over its box, so the
+    PDF can be searched and copied from while only the image is visible.
+    `scale` converts source image pixels to mm on the page.
+    """
+    left, top, right, bottom = box_geometry(ocr_result)
+
+    with pdf.local_context(text_mode='INVISIBLE'):
+        for i, text in enumerate(ocr_result.texts):
+            height = float(bottom[i] - top[i]) * scale
+            if height <= 0 or not text.strip():
+                continue
+            pdf.set_font('DejaVu', '', height * 72 / 25.4)  # Font size is in points
+            pdf.text(PDF_IMAGE_X + float(left[i]) * scale, PDF_IMAGE_Y + float(bottom[i]) * scale, text)
+
+def create_selectable_pdf_from_image(image_path, pdf_path, ocr_result=None):
+    import cv2
+
+    try:
+        # Create a new PDF with UTF-8 support
+        pdf = new_utf8_pdf()
+        pdf.add_page()
+
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"Image at {image_path} could not be loaded.")
+        height, width = image.shape[:2]
+
+        # Shrink the image to the target width and re-encode it as JPEG
+        if width > PDF_IMAGE_MAX_WIDTH:
+            image = cv2.resize(image, (PDF_IMAGE_MAX_WIDTH, int(height * PDF_IMAGE_MAX_WIDTH / width)), interpolation=cv2.INTER_AREA)
+        _, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, PDF_IMAGE_JPEG_QUALITY])
+
+        # Add the image to the PDF
+        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as jpeg_file:
+            jpeg_file.write(jpeg.tobytes())
+        try:
+            pdf.image(jpeg_file.name, x=PDF_IMAGE_X, y=PDF_IMAGE_Y, w=PDF_IMAGE_WIDTH)
+        finally:
+            os.remove(jpeg_file.name)
+
+        # Add the OCR text on top of the image so it can be selected
+        if ocr_result is not None and len(ocr_result):
+            add_invisible_text_layer(pdf, ocr_result, PDF_IMAGE_WIDTH / width)
+
+        # Save the PDF
+        os.makedirs(os.path.dirname(os.path.abspath(pdf_path)), exist_ok=True)
+        pdf.output(pdf_path)
+        logger.info(f"Created selectable PDF at {pdf_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error creating selectable PDF: {e}")
+        return False
+
+def export_searchable_pdf(image_path, ocr_result):
+    """
+    With PDF_EXPORT on, save an uploaded image with its OCR text as a searchable PDF in
+    PDF_FOLDER and return the PDF's path. Returns None when the export is off, failed, or
+    the upload is a PDF or TIFF already.
+    """
+    extension = os.path.splitext(image_path)[1].lstrip('.').lower()
+    if not PDF_EXPORT or extension not in IMAGE_EXTENSIONS:
+        return None
+
+    pdf_path = os.path.join(PDF_FOLDER, os.path.splitext(os.path.basename(image_path))[0] + '.pdf')
+    with span('pdf_export'):
+        return pdf_path if create_selectable_pdf_from_image(image_path, pdf_path, ocr_result) else None
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import multiprocessing
+import multiprocessing.util
+from contextlib import contextmanager
+from models.memory_profile import is_enabled as is_profiling_memory, profile_stage
+
+logger = logging.getLogger(__name__)
+
+# Where finished spans go: a JSON-lines file, a Zipkin-compatible collector
+# (e.g. http://localhost:9411/api/v2/spans), or both. Tracing is off when neither is set
+TRACE_FILE = os.getenv('TRACE_FILE')
+TRACE_COLLECTOR_URL = os.getenv('TRACE_COLLECTOR_URL')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'gobingo-bot')
+TRACING_ENABLED = bool(TRACE_FILE or TRACE_COLLECTOR_URL)
+
+TRACE_BATCH_SIZE = 64
+TRACE_FLUSH_SECONDS = 1.0
+
+# (trace_id, span_id) of the active span. A ContextVar, so concurrent handlers on the
+# event loop each see their own; threads and worker processes adopt one with activate()
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+class SpanExporter:
+    """
+    Writes finished spans in Zipkin v2 JSON from a background thread, in batches, so
+    tracing never blocks the event loop or an OCR stage on disk or network I/O.
+    """
+
+    def __init__(self, path=TRACE_FILE, collector_url=TRACE_COLLECTOR_URL):
+        self.path = path
+        self.collector_url = collector_url
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+        self._thread.start()
+
+    def export(self, record):
+        self._queue.put(record)
+
+    def flush(self, timeout=5.0):
+        """
+        Block until every span exported so far has been written.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get(timeout=TRACE_FLUSH_SECONDS)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, dict):
+                batch.append(item)
+                if len(batch) < TRACE_BATCH_SIZE:
+                    continue
+
+            if batch:
+                self._write(batch)
+                batch = []
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _write(self, batch):
+        try:
+            if self.path:
+                # One append-mode write per batch, so lines from several processes don't interleave
+                data = ''.join(json.dumps(record) + '\n' for record in batch).encode()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+
+            if self.collector_url:
+                import requests
+                requests.post(self.collector_url, json=batch, timeout=5)
+
+        except Exception as e:
+            logger.warning(f"Failed to export {len(batch)} trace span(s): {e}")
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = SpanExporter()
+                atexit.register(_exporter.flush)
+                if multiprocessing.parent_process() is not None:
+                    # Worker processes exit without running atexit hooks, but run these
+                    multiprocessing.util.Finalize(None, _exporter.flush, exitpriority=10)
+    return _exporter
+
+
+def flush_spans():
+    """
+    Write out pending spans now. The exporter writes them within TRACE_FLUSH_SECONDS on
+    its own and flushes when its process exits, so this is only for callers that need
+    them on disk at a given point.
+    """
+    if _exporter is not None:
+        _exporter.flush()
+
+
+def current_context():
+    """
+    The active span as a picklable (trace_id, span_id), to hand to another thread or
+    process; None if there is none or tracing is off.
+    """
+    return _current_span.get()
+
+
+@contextmanager
+def activate(context):
+    """
+    Make a span context from another thread or process the parent of spans started here.
+    """
+    token = _current_span.set(context)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, **tags):
+    """
+    Time a block as a child of the active span, or as the root of a new trace if there is
+    none. Exceptions are recorded on the span and re-raised. With memory profiling on, the
+    block is also a stage of the memory report (see models.memory_profile).
+    """
+    if is_profiling_memory():
+        with profile_stage(name, tags), _span(name, tags):
+            yield
+    else:
+        with _span(name, tags):
+            yield
+
+
+@contextmanager
+def _span(name, tags):
+    if not TRACING_ENABLED:
+        yield
+        return
+
+    parent = _current_span.get()
+    trace_id = parent[0] if parent else os.urandom(16).hex()
+    span_id = os.urandom(8).hex()
+    token = _current_span.set((trace_id, span_id))
+
+    timestamp = int(time.time() * 1e6)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        tags['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+
+        record = {
+            'traceId': trace_id,
+            'id': span_id,
+            'name': name,
+            'timestamp': timestamp,
+            'duration': max(int((time.perf_counter() - start) * 1e6), 1),
+            'localEndpoint': {'serviceName': TRACE_SERVICE_NAME},
+            'tags': {key: str(value) for key, value in tags.items()},
+        }
+        if parent:
+            record['parentId'] = parent[1]
+        record['tags']['process'] = multiprocessing.current_process().name
+        record['tags']['thread'] = threading.current_thread().name
+
+        get_exporter().export(record)
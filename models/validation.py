@@ -0,0 +1,264 @@
+import re
+import logging
+from datetime import date
+from difflib import SequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+# NRIC/FIN check letters: weighted digit sum plus the prefix's offset, mod 11, indexes the prefix's table
+NRIC_WEIGHTS = (2, 7, 6, 5, 4, 3, 2)
+NRIC_CHECK_TABLES = {
+    'S': (0, 'JZIHGFEDCBA'),
+    'T': (4, 'JZIHGFEDCBA'),
+    'F': (0, 'XWUTRQPNMLK'),
+    'G': (4, 'XWUTRQPNMLK'),
+    'M': (3, 'XWUTRQPNJLK'),
+}
+NRIC_PATTERN = re.compile(r'([STFGM])(\d{7})([A-Z])')
+
+# Vehicle plate check letters: the last two prefix letters (A=1 ... Z=26) and the number padded
+# to four digits, weighted, mod 19
+PLATE_WEIGHTS = (9, 4, 5, 4, 3, 2)
+PLATE_CHECK_LETTERS = 'AZYXUTSRPMLKJHGEDCB'
+PLATE_PATTERN = re.compile(r'([A-Z]{1,3})(\d{1,4})([A-Z])')
+
+# Characters OCR mistakes for one another, by what the position should hold
+DIGIT_LOOKALIKES = {'O': '0', 'D': '0', 'Q': '0', 'U': '0', 'I': '1', 'L': '1', 'J': '1', 'Z': '2',
+                    'A': '4', 'S': '5', 'G': '6', 'T': '7', 'B': '8'}
+LETTER_LOOKALIKES = {'0': 'O', '1': 'I', '2': 'Z', '4': 'A', '5': 'S', '6': 'G', '7': 'T', '8': 'B'}
+
+MONTHS = {
+    month: number
+    for number, names in enumerate((('JAN', 'JANUARY'), ('FEB', 'FEBRUARY'), ('MAR', 'MARCH'), ('APR', 'APRIL'),
+                                    ('MAY',), ('JUN', 'JUNE'), ('JUL', 'JULY'), ('AUG', 'AUGUST'),
+                                    ('SEP', 'SEPT', 'SEPTEMBER'), ('OCT', 'OCTOBER'), ('NOV', 'NOVEMBER'),
+                                    ('DEC', 'DECEMBER')), start=1)
+    for month in names
+}
+
+# Date layouts found on the documents, as (pattern, order of the day/month/year groups)
+DATE_FORMATS = (
+    (re.compile(r'(\d{1,2})[-/. ](\d{1,2})[-/. ](\d{4})'), ('day', 'month', 'year')),
+    (re.compile(r'(\d{4})[-/. ](\d{1,2})[-/. ](\d{1,2})'), ('year', 'month', 'day')),
+    (re.compile(r'(\d{1,2})[-/. ]?([A-Z]{3,9})[-/. ]?(\d{4})'), ('day', 'month', 'year')),
+)
+
+# Names at least this similar (0-1, word order ignored) are taken to be the same person
+NAME_MATCH_RATIO = 0.85
+
+
+def nric_check_letter(prefix, digits):
+    offset, table = NRIC_CHECK_TABLES[prefix]
+    total = offset + sum(int(digit) * weight for digit, weight in zip(digits, NRIC_WEIGHTS))
+    return table[total % 11]
+
+
+def is_valid_nric(value):
+    match = NRIC_PATTERN.fullmatch(str(value or '').replace(' ', '').upper())
+    return bool(match) and nric_check_letter(match.group(1), match.group(2)) == match.group(3)
+
+
+def plate_check_letter(letters, digits):
+    letters = letters[-2:].rjust(2, '@')  # '@' is 0: a one-letter prefix has no first letter
+    values = [ord(letter) - ord('@') for letter in letters] + [int(digit) for digit in digits.rjust(4, '0')]
+    return PLATE_CHECK_LETTERS[sum(value * weight for value, weight in zip(values, PLATE_WEIGHTS)) % 19]
+
+
+def is_valid_plate(value):
+    match = PLATE_PATTERN.fullmatch(str(value or '').replace(' ', '').upper())
+    return bool(match) and plate_check_letter(match.group(1), match.group(2)) == match.group(3)
+
+
+# Checksum-verified fields; the OCR cascade trusts a value that passes
+FIELD_VALIDATORS = {
+    'Identity_Card_No': is_valid_nric,
+    'License_Number': is_valid_nric,
+    'Vehicle_No': is_valid_plate,
+}
+
+
+def _fix_positions(value, layout):
+    """
+    Swap each character for its lookalike where the layout ('L' letter, 'D' digit) says
+    the other kind belongs.
+    """
+    fixed = []
+    for char, kind in zip(value, layout):
+        if kind == 'D' and not char.isdigit():
+            char = DIGIT_LOOKALIKES.get(char, char)
+        elif kind == 'L' and char.isdigit():
+            char = LETTER_LOOKALIKES.get(char, char)
+        fixed.append(char)
+    return ''.join(fixed)
+
+
+def _repair(read_body, body, letter, check_letter):
+    """
+    Shared tail of correct_nric/correct_plate: the value `body` (`read_body` with its
+    lookalikes swapped by position) and the check letter as read stand for, or None.
+
+    The checksum only vouches for a repair if the rest was left as read, so the check
+    letter is only repaired (read as a lookalike of the one the body calls for) when the
+    body needed no repair. Digits are never guessed against the checksum: about one in
+    eleven substitutions passes it, so a misread would as often be "repaired" into
+    someone else's valid number as into the right one.
+    """
+    expected = check_letter(body)
+    if letter == expected:
+        return body + letter
+    if body == read_body and (LETTER_LOOKALIKES.get(letter) == expected or DIGIT_LOOKALIKES.get(expected) == letter):
+        return body + expected
+    return None
+
+
+def correct_nric(value):
+    """
+    Deterministically repair a misread NRIC/FIN (e.g. 'S12345G7D' -> 'S1234567D'). Values
+    that can't be repaired with certainty are returned unchanged.
+
+    Every swap is forced by position, so there are no alternatives to rank: OCR confidence
+    doesn't decide anything here. It couldn't anyway, the engines score words and lines,
+    not characters.
+    """
+    normalized = str(value or '').replace(' ', '').upper()
+    if is_valid_nric(normalized):
+        return normalized
+    if len(normalized) != 9:
+        return value
+
+    read_body, letter = normalized[:-1], normalized[-1]
+    body = _fix_positions(read_body, 'LDDDDDDD')
+    if body[0] not in NRIC_CHECK_TABLES or not body[1:].isdigit():
+        return value
+
+    return _repair(read_body, body, letter, lambda body: nric_check_letter(body[0], body[1:])) or value
+
+
+def _plate_split(body):
+    """
+    Length of the letter prefix of a plate body read as letters then 1-4 digits, or None.
+    """
+    match = re.fullmatch(r'([A-Z]{1,3})\d{1,4}', body)
+    return len(match.group(1)) if match else None
+
+
+def correct_plate(value):
+    """
+    Deterministically repair a misread vehicle plate, the same way as correct_nric().
+    """
+    normalized = str(value or '').replace(' ', '').upper()
+    if is_valid_plate(normalized):
+        return normalized
+    if not (3 <= len(normalized) <= 8 and normalized.isalnum()):
+        return value
+
+    read_body, letter = normalized[:-1], normalized[-1]
+
+    # A body read as letters then digits splits there. Otherwise where the prefix ends is a
+    # guess too ('5BS3229P' is 'SBS3229P'), so every split is tried, and it takes the
+    # checksum accepting exactly one of them, whatever order they are tried in
+    prefix_length = _plate_split(read_body)
+    prefix_lengths = [prefix_length] if prefix_length else range(1, min(3, len(read_body) - 1) + 1)
+
+    candidates = set()
+    for prefix_length in prefix_lengths:
+        body = _fix_positions(read_body, 'L' * prefix_length + 'D' * (len(read_body) - prefix_length))
+        if _plate_split(body) != prefix_length:
+            continue
+        candidate = _repair(read_body, body, letter,
+                            lambda body: plate_check_letter(body[:prefix_length], body[prefix_length:]))
+        if candidate:
+            candidates.add(candidate)
+    return candidates.pop() if len(candidates) == 1 else value
+
+
+def normalize_date(value):
+    """
+    The date in `value` as ISO 'YYYY-MM-DD', whatever layout the document printed it in,
+    or None if there is no valid date.
+    """
+    text = str(value or '').upper()
+    for pattern, order in DATE_FORMATS:
+        match = pattern.search(text)
+        if not match:
+            continue
+
+        parts = dict(zip(order, match.groups()))
+        month = parts['month']
+        month = MONTHS.get(month) if month.isalpha() else int(month)
+        try:
+            return date(int(parts['year']), month, int(parts['day'])).isoformat()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def normalize_name(value):
+    """
+    A name reduced to its uppercase words, without punctuation or the underscores of
+    sanitized names.
+    """
+    return ' '.join(re.sub(r'[^A-Z]+', ' ', str(value or '').upper()).split())
+
+
+def names_match(first, second):
+    first, second = sorted(normalize_name(first).split()), sorted(normalize_name(second).split())
+    if not first or not second:
+        return True  # Nothing to compare
+    return SequenceMatcher(None, ' '.join(first), ' '.join(second)).ratio() >= NAME_MATCH_RATIO
+
+
+def correct_document(document_type, fields):
+    """
+    Repair the checksum-carrying fields of one document's parsed fields in place and
+    return them.
+    """
+    for field, correct in (('Identity_Card_No', correct_nric), ('License_Number', correct_nric),
+                           ('Vehicle_No', correct_plate)):
+        value = fields.get(field)
+        if not value or value == 'Unknown':
+            continue
+
+        corrected = correct(value)
+        if corrected != value:
+            logger.info(f"Corrected {document_type} {field} from OCR reading {value!r}.")
+        fields[field] = corrected
+    return fields
+
+
+def cross_check(fields):
+    """
+    Compare the fields of a holder's documents (merged into one dict) against each other.
+    Returns (corrections, issues): fields to overwrite, where one document's checksum-valid
+    value settles another's invalid one, and descriptions of disagreements left for a
+    person to look at.
+    """
+    corrections = {}
+    issues = []
+
+    # The license number is the holder's NRIC/FIN
+    id_number, license_number = fields.get('Identity_Card_No'), fields.get('License_Number')
+    if id_number and license_number and 'Unknown' not in (id_number, license_number) and (
+            id_number != license_number or not is_valid_nric(id_number)):
+        if is_valid_nric(id_number) and not is_valid_nric(license_number):
+            corrections['License_Number'] = id_number
+        elif is_valid_nric(license_number) and not is_valid_nric(id_number):
+            corrections['Identity_Card_No'] = license_number
+        elif id_number == license_number:
+            issues.append(f"ID and license number {id_number} fail their check letter")
+        else:
+            issues.append(f"ID number {id_number} differs from license number {license_number}")
+
+    birth_date, license_birth_date = normalize_date(fields.get('Date_of_birth')), normalize_date(fields.get('Birth_Date'))
+    if birth_date and license_birth_date and birth_date != license_birth_date:
+        issues.append(f"Date of birth {birth_date} on the identity card, {license_birth_date} on the license")
+
+    name, license_name = fields.get('Name'), fields.get('License_Name')
+    if 'Unknown' not in (name, license_name) and not names_match(name, license_name):
+        issues.append(f"Name {name!r} on the identity card, {license_name!r} on the license")
+
+    vehicle_no = fields.get('Vehicle_No')
+    if vehicle_no and vehicle_no != 'Unknown' and not is_valid_plate(vehicle_no):
+        issues.append(f"Vehicle number {vehicle_no} fails its check letter")
+
+    return corrections, issues
@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import importlib
+from models.tracing import span
+from models.concurrency import pin_library_threads
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_TYPES = ('identity_card', 'drivers_license', 'log_card')
+
+# Text a real card of each type carries, for cards drawn at warm-up and by the benchmarks.
+# The numbers pass their check letters, so the validation path runs as for a good upload
+SYNTHETIC_CARD_LINES = {
+    'identity_card': ['REPUBLIC OF SINGAPORE', 'IDENTITY CARD NO. S1234567D', 'Name', 'TAN AH KOW',
+                      'Race CHINESE', 'Date of birth 01-01-1990', 'Sex M', 'Country of birth SINGAPORE'],
+    'drivers_license': ['DRIVING LICENCE', 'Licence No. S1234567D', 'Name TAN AH KOW',
+                        'Birth Date 01 Jan 1990', 'Issue Date 15 Mar 2010'],
+    'log_card': ['VEHICLE REGISTRATION', 'Vehicle No. SGX1234B', 'Vehicle Type PASSENGER MOTOR CAR',
+                 'Make/Model TOYOTA COROLLA', 'Year of Manufacture 2018', 'Chassis No. NZE1610123456',
+                 'Engine No. 1NZ1234567', 'Original Registration Date 02 Feb 2018'],
+}
+
+_ready = threading.Event()
+_durations = {}  # Component -> seconds, as measured by the last warm-up of this process
+_warm_up_lock = threading.Lock()
+
+
+def synthetic_card(document_type, path):
+    """
+    Draw a plain card with the text a real one of this type carries and save it to `path`.
+    """
+    import cv2
+    import numpy as np
+
+    lines = SYNTHETIC_CARD_LINES[document_type]
+    image = np.full((80 + 60 * len(lines), 1200, 3), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(image, line, (40, 80 + 60 * i), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2, cv2.LINE_AA)
+    cv2.imwrite(path, image)
+    return path
+
+
+def _timed(component, function, *args):
+    start = time.perf_counter()
+    with span('warm_up', component=component):
+        function(*args)
+    _durations[component] = time.perf_counter() - start
+
+
+def warm_up():
+    """
+    Pay this process's cold-start costs before it sees an upload: load every OCR engine,
+    then run a synthetic card of each document type through every stage of the OCR
+    cascade and its parser. Nothing is written to Firestore or sent to Monday. Runs once
+    per process; returns the seconds each component took.
+    """
+    with _warm_up_lock:
+        if _ready.is_set():
+            return dict(_durations)
+
+        from models.ocr_engine import OCR_CASCADE, get_tesseract, get_easyocr_reader, run_ocr_cascade
+        from models.model import REQUIRED_FIELDS, parse_document
+        from models.validation import FIELD_VALIDATORS
+
+        # Loading the native library is most of OpenCV's first-call cost
+        _timed('opencv', importlib.import_module, 'cv2')
+        _timed('tesseract', lambda: get_tesseract().get_tesseract_version())
+        if any(engine == 'easyocr' for engine, _ in OCR_CASCADE):
+            _timed('easyocr', get_easyocr_reader)
+        pin_library_threads()  # Now that torch and OpenCV are loaded
+
+        def run_document(document_type, path):
+            # One stage at a time, so the heavier stages run even though the card reads cleanly
+            for stage in OCR_CASCADE:
+                run_ocr_cascade(
+                    path,
+                    parse=lambda ocr_result: parse_document(document_type, ocr_result),
+                    required_fields=REQUIRED_FIELDS[document_type],
+                    cascade=(stage,),
+                    validators=FIELD_VALIDATORS
+                )
+
+        with tempfile.TemporaryDirectory(prefix='warm_up_') as directory:
+            for document_type in DOCUMENT_TYPES:
+                path = synthetic_card(document_type, os.path.join(directory, f"{document_type}.png"))
+                _timed(document_type, run_document, document_type, path)
+
+        _ready.set()
+        logger.info("Warm-up done: " + ', '.join(f"{component} {seconds * 1000:.0f} ms"
+                                                 for component, seconds in _durations.items()))
+        return dict(_durations)
+
+
+def mark_ready(durations=None):
+    """
+    Declare the bot ready, for a process whose OCR warmed up elsewhere (the OCR workers).
+    """
+    if durations:
+        _durations.update(durations)
+    _ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def warm_up_durations():
+    return dict(_durations)
@@ -0,0 +1,57 @@
+import logging
+from dotenv import load_dotenv
+from flask import Flask, request
+from models.model import process_uploaded_document
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)  # Define the Flask app
+
+
+# Modify the /upload_document route to handle log card processing
+@app.route('/upload_document', methods=['POST'])
+def upload_document():
+    if 'file' not in request.files:
+        return 'No file part', 400
+
+    file = request.files['file']
+    document_type = request.form.get('document_type', 'identity_card')  # Default to identity card if not specified
+    holder_key = request.form.get('holder_key')  # Retrieve holder_key from the form
+
+    if file.filename == '':
+        return 'No selected file', 400
+
+    if file:
+        extracted_data = process_uploaded_document(file, document_type, holder_key=holder_key)
+        
+        if extracted_data:
+            if document_type == 'identity_card':
+                # Store holder_key for subsequent uploads (driver's license, log card)
+                holder_key = extracted_data.get('holder_key')
+
+                # Ask for driver's license next
+                return {
+                    'message': 'Identity card processed. Please upload the driver\'s license.',
+                    'holder_key': holder_key  # Pass holder_key back to the client
+                }, 200
+
+            elif document_type == 'drivers_license':
+                return {
+                    'message': 'Driver\'s license processed. Please upload the log card.',
+                    'holder_key': holder_key  # Pass holder_key back to the client
+                }, 200
+
+            elif document_type == 'log_card':
+                return {
+                    'message': 'Log card processed successfully!',
+                    'extracted_data': extracted_data
+                }, 200
+        else:
+            return 'Failed to process image', 500
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('numpy')
+pytest.importorskip('dotenv')
+
+from telegram import Update
+
+from benchmarks.replay import make_replay_bot, upload_message
+from controllers import bot_controller
+from models.cancellation import JobCancelled
+
+USER_ID = 100001
+
+
+def start_message():
+    return {
+        'message_id': 1,
+        'date': 0,
+        'chat': {'id': USER_ID, 'type': 'private'},
+        'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'Test'},
+        'text': '/start',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    }
+
+
+def test_second_upload_supersedes_the_first(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from main import build_application
+
+    first, second = tmp_path / 'first.png', tmp_path / 'second.png'
+    first.write_bytes(b'first')
+    second.write_bytes(b'second')
+
+    started = []
+
+    async def fake_process_document(document_type, image_path, user_id, holder_key=None, cancel_token=None,
+                                    trace_context=None):
+        started.append(open(image_path, 'rb').read())
+        if len(started) == 1:
+            # Still running when the second upload arrives; stops at its next stage boundary
+            while not cancel_token.is_set():
+                await asyncio.sleep(0.01)
+            raise JobCancelled('ocr')
+        return {'holder_key': 'second holder', 'sanitized_name': 'SECOND'}
+
+    monkeypatch.setattr(bot_controller, 'process_document', fake_process_document)
+
+    bot = make_replay_bot(None)
+    app = build_application(bot=bot)
+    updates = [start_message(), upload_message(USER_ID, 2, str(first)), upload_message(USER_ID, 3, str(second))]
+
+    async def send_updates():
+        async with app:
+            for update_id, message in enumerate(updates, 1):
+                await app.process_update(Update.de_json({'update_id': update_id, 'message': message}, app.bot))
+                if update_id == 2:
+                    while not started:  # The first upload is running before the second is sent
+                        await asyncio.sleep(0.01)
+            await bot_controller.wait_for_uploads(USER_ID)
+
+    asyncio.run(send_updates())
+
+    assert started == [b'first', b'second']
+    assert app.user_data[USER_ID]['holder_key'] == 'second holder'
+    assert app.user_data[USER_ID]['document_type'] == 'drivers_license'
+    successes = [reply for reply in bot.replies[USER_ID] if reply.startswith('Identity Card uploaded successfully')]
+    assert len(successes) == 1
@@ -0,0 +1,26 @@
+import os
+
+from models.firestore_writer import FirestoreWriteBehind, _spool_name, _try_lock
+
+
+def test_recovery_removes_half_written_spool_files_of_stopped_writers(tmp_path):
+    spool_dir = str(tmp_path)
+    owners_dir = os.path.join(spool_dir, 'owners')
+    os.makedirs(owners_dir)
+
+    # One writer stopped mid-write, the other is still running and writing
+    open(os.path.join(owners_dir, 'stopped.lock'), 'a').close()
+    running_lock = _try_lock(os.path.join(owners_dir, 'running.lock'))
+    stopped_temp = _spool_name(1, 'stopped') + '.tmp'
+    running_temp = _spool_name(2, 'running') + '.tmp'
+    for name in (stopped_temp, running_temp):
+        with open(os.path.join(spool_dir, name), 'w') as f:
+            f.write('{"path": ')
+
+    try:
+        writer = FirestoreWriteBehind(spool_dir=spool_dir)
+        assert len(writer) == 0
+        assert sorted(os.listdir(spool_dir)) == [running_temp, 'owners']
+        assert not os.path.exists(os.path.join(owners_dir, 'stopped.lock'))
+    finally:
+        running_lock.close()
@@ -0,0 +1,138 @@
+import time
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from models.holder_records import HolderAggregator, REQUIRED_DOCUMENTS
+from models.validation import nric_check_letter
+
+HOLDERS = 100
+ROUNDS = 3
+THREADS = 32
+
+
+def holder_id_number(i):
+    digits = f"{1000000 + i:07d}"
+    return 'S' + digits + nric_check_letter('S', digits)
+
+
+def run_rounds(upload, keys, rounds=ROUNDS, threads=THREADS):
+    """
+    Each round, upload every document of every holder once, shuffled across a thread pool,
+    and yield once all of them are done.
+    """
+    for round_number in range(1, rounds + 1):
+        uploads = [(key, document_type) for key in keys for document_type in REQUIRED_DOCUMENTS]
+        random.shuffle(uploads)
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(upload, key, document_type) for key, document_type in uploads]:
+                future.result()
+        yield round_number
+
+
+def test_each_holder_completes_once_per_round():
+    sent = Counter()
+    sent_lock = threading.Lock()
+
+    def on_complete(key, fields):
+        time.sleep(random.uniform(0, 0.002))  # Fake Monday.com round trip
+        assert set(fields) == {'Identity_Card_No', 'License_Number', 'Vehicle_No'}
+        with sent_lock:
+            sent[key] += 1
+        return True
+
+    aggregator = HolderAggregator(on_complete=on_complete)
+
+    def upload(key, document_type):
+        time.sleep(random.uniform(0, 0.002))  # Fake OCR
+        field = {'identity_card': 'Identity_Card_No', 'drivers_license': 'License_Number', 'log_card': 'Vehicle_No'}
+        aggregator.merge(key, document_type, {field[document_type]: key})
+
+    keys = [f"{i:05d}" for i in range(HOLDERS)]
+    for round_number in run_rounds(upload, keys):
+        assert sent == {key: round_number for key in keys}
+    assert len(aggregator._holder_locks) == 0
+
+
+def test_failed_completion_is_retried_by_the_next_upload():
+    results = [False, True]
+    calls = []
+
+    def on_complete(key, fields):
+        calls.append(fields)
+        return results[len(calls) - 1]
+
+    aggregator = HolderAggregator(on_complete=on_complete)
+    assert aggregator.merge('k', 'identity_card', {'Name': 'TAN'}) is None
+    assert aggregator.merge('k', 'drivers_license', {'License_Number': 'S1234567D'}) is None
+    assert aggregator.merge('k', 'log_card', {'Vehicle_No': 'SBS3229P'}) is False
+    assert aggregator.pending_documents('k') == []
+
+    assert aggregator.merge('k', 'log_card', {'Vehicle_No': 'SBS3229P'}) is True
+    assert calls[1] == {'Name': 'TAN', 'License_Number': 'S1234567D', 'Vehicle_No': 'SBS3229P'}
+    assert aggregator.get('k') == {}
+
+
+class FakeFirestoreWriter:
+    def set(self, path, data, merge=False):
+        pass
+
+    def add(self, collection_path, data):
+        return 'document'
+
+
+def test_process_functions_send_each_holder_once_per_round(monkeypatch):
+    pytest.importorskip('numpy')
+    pytest.importorskip('dotenv')
+    pytest.importorskip('firebase_admin')
+    monkeypatch.setenv('HOLDER_KEY_SALT', 'test')
+    from models import model
+    from models.holder_keys import holder_key_for
+
+    id_numbers = {holder_key_for(holder_id_number(i)): holder_id_number(i) for i in range(HOLDERS)}
+    fake_fields = {
+        'identity_card': lambda id_number: {'Identity_Card_No': id_number, 'Name': f"HOLDER {id_number}"},
+        'drivers_license': lambda id_number: {'License_Number': id_number, 'Birth_Date': '01 Jan 1990',
+                                              'Name': f"HOLDER {id_number}"},
+        'log_card': lambda id_number: {'Vehicle_No': 'SBS3229P', 'Make_Model': 'TOYOTA COROLLA'},
+    }
+
+    def fake_run_ocr_cascade(image_path, parse, required_fields, cascade=None, validators=None):
+        time.sleep(random.uniform(0, 0.002))
+        document_type, id_number = image_path.split('/')
+        return fake_fields[document_type](id_number), object()
+
+    sent = Counter()
+    sent_lock = threading.Lock()
+
+    def fake_send_data_to_monday(holder_data):
+        with sent_lock:
+            sent[holder_data['Identity_Card_No']] += 1
+        return True
+
+    monkeypatch.setattr(model, 'run_ocr_cascade', fake_run_ocr_cascade)
+    monkeypatch.setattr(model, 'get_firestore_writer', FakeFirestoreWriter)
+    monkeypatch.setattr(model, 'send_data_to_monday', fake_send_data_to_monday)
+    monkeypatch.setattr(model, 'holder_records', HolderAggregator(on_complete=model.send_completed_holder_to_monday))
+
+    submitted = Counter()
+
+    def upload(holder_key, document_type):
+        image_path = f"{document_type}/{id_numbers[holder_key]}"
+        if document_type == 'identity_card':
+            data = model.process_identity_card(image_path, user_id=holder_key)
+            assert data['holder_key'] == holder_key
+        elif document_type == 'drivers_license':
+            data = model.process_drivers_license(image_path, holder_key)
+        else:
+            data = model.process_log_card(image_path, holder_key)
+        if data.get('holder_submitted'):
+            with sent_lock:
+                submitted[holder_key] += 1
+
+    for round_number in run_rounds(upload, list(id_numbers)):
+        assert sent == {id_number: round_number for id_number in id_numbers.values()}
+        assert submitted == {holder_key: round_number for holder_key in id_numbers}
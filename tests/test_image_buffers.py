@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from models import image_buffers
+from models.image_buffers import scratch_buffer, trim_scratch_buffers
+
+
+def test_scratch_buffer_is_reused_until_trimmed():
+    small = scratch_buffer('test_small', (10, 10))
+    assert scratch_buffer('test_small', (10, 10)) is small
+
+    trim_scratch_buffers(max_bytes=1024)  # 100 bytes held: kept
+    assert scratch_buffer('test_small', (10, 10)) is small
+
+    trim_scratch_buffers(max_bytes=0)
+    assert scratch_buffer('test_small', (10, 10)) is not small
+
+
+def test_trim_reaches_other_threads():
+    held = []
+    thread = threading.Thread(target=lambda: held.append(scratch_buffer('test_large', (1000, 1000))))
+    thread.start()
+    thread.join()
+    assert image_buffers._scratch_by_thread[thread]
+
+    trim_scratch_buffers(max_bytes=1024)
+    assert image_buffers._scratch_by_thread[thread] == {}
+    assert held[0].shape == (1000, 1000)  # Still usable by whoever holds it
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('fpdf')
+
+from models import pdf_export
+from models.ocr_engine import OCRResult
+
+
+def card_ocr_result():
+    boxes = [[[40, 50], [300, 50], [300, 80], [40, 80]], [[320, 50], [520, 50], [520, 80], [320, 80]]]
+    return OCRResult('tesseract', boxes, ['Name', 'TAN AH KOW'], [0.9, 0.8], 'Name TAN AH KOW')
+
+
+def test_text_layer_is_invisible():
+    pdf = pdf_export.new_utf8_pdf()
+    pdf.set_compression(False)
+    pdf.add_page()
+    pdf_export.add_invisible_text_layer(pdf, card_ocr_result(), pdf_export.PDF_IMAGE_WIDTH / 600)
+
+    content = bytes(pdf.output())
+    assert b'3 Tr' in content  # Render mode 3: neither filled nor stroked
+
+
+def test_export_searchable_pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_export, 'PDF_EXPORT', True)
+    monkeypatch.setattr(pdf_export, 'PDF_FOLDER', str(tmp_path / 'pdf'))
+    image_path = str(tmp_path / 'identity_card.png')
+    cv2.imwrite(image_path, np.full((200, 600, 3), 255, dtype=np.uint8))
+
+    pdf_path = pdf_export.export_searchable_pdf(image_path, card_ocr_result())
+    assert pdf_path == str(tmp_path / 'pdf' / 'identity_card.pdf')
+    with open(pdf_path, 'rb') as f:
+        assert f.read(5) == b'%PDF-'
+
+    assert pdf_export.export_searchable_pdf(str(tmp_path / 'upload.pdf'), card_ocr_result()) is None
+    monkeypatch.setattr(pdf_export, 'PDF_EXPORT', False)
+    assert pdf_export.export_searchable_pdf(image_path, card_ocr_result()) is None
+    assert os.listdir(tmp_path / 'pdf') == ['identity_card.pdf']
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+
+from controllers.concurrency_controller import ConcurrencyController
+from controllers.upload_scheduler import FairUploadScheduler, UploadSuperseded
+from models.cancellation import JobCancelled, cancellable, current_token, raise_if_cancelled
+from models.concurrency import available_cores, current_job_threads, job_threads
+
+
+def test_running_upload_stops_at_its_next_stage():
+    scheduler = FairUploadScheduler(concurrency=4)
+    stages = []
+    ocr_started = threading.Event()
+    release = threading.Event()
+
+    def job(name, cancel_token):
+        with cancellable(cancel_token):
+            stages.append((name, 'ocr'))
+            if name == 'first':
+                ocr_started.set()
+                release.wait(5)
+            raise_if_cancelled('ocr')
+            stages.append((name, 'write'))
+            return name
+
+    async def upload(name):
+        return await scheduler.run('user', 'identity_card', lambda cancel_token: asyncio.to_thread(job, name, cancel_token))
+
+    async def main():
+        first = asyncio.ensure_future(upload('first'))
+        await asyncio.to_thread(ocr_started.wait, 5)
+        second = asyncio.ensure_future(upload('second'))
+        await asyncio.sleep(0)  # The second upload sets the first one's cancel token on arrival
+        release.set()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, UploadSuperseded)
+    assert second == 'second'
+    assert ('first', 'write') not in stages
+    assert scheduler.running == 0
+
+
+def test_thread_budget_shares_the_cores_among_running_uploads():
+    controller = ConcurrencyController(FairUploadScheduler(concurrency=4))
+    controller.cores = 8
+    budgets = []
+    for running in (1, 3, 4, 16):
+        controller.scheduler._running = running
+        budgets.append(controller.thread_budget())
+    assert budgets == [8, 2, 2, 1]
+
+    assert current_job_threads() == available_cores()
+    with job_threads(2):
+        assert current_job_threads() == 2
+    assert current_job_threads() == available_cores()
+
+
+class RecordingFirestoreWriter:
+    writes = []
+
+    def set(self, path, data, merge=False):
+        self.writes.append(path)
+
+    def add(self, collection_path, data):
+        self.writes.append(collection_path)
+        return 'document'
+
+
+def test_superseded_job_never_writes_to_firestore(monkeypatch):
+    pytest.importorskip('numpy')
+    pytest.importorskip('dotenv')
+    pytest.importorskip('firebase_admin')
+    monkeypatch.setenv('HOLDER_KEY_SALT', 'test')
+    from models import model
+    from models.holder_records import HolderAggregator, REQUIRED_DOCUMENTS
+    from models.ocr_workers import run_document_job
+
+    def fake_run_ocr_cascade(image_path, parse, required_fields, cascade=None, validators=None):
+        current_token().set()  # A newer upload of the card arrived while this one was being read
+        return {'Identity_Card_No': 'S1234567D', 'Name': 'TAN AH KOW'}, object()
+
+    monkeypatch.setattr(model, 'run_ocr_cascade', fake_run_ocr_cascade)
+    monkeypatch.setattr(model, 'export_searchable_pdf', lambda image_path, ocr_result: None)
+    monkeypatch.setattr(model, 'get_firestore_writer', RecordingFirestoreWriter)
+    monkeypatch.setattr(RecordingFirestoreWriter, 'writes', [])
+    monkeypatch.setattr(model, 'holder_records', HolderAggregator(on_complete=lambda key, fields: True))
+
+    with pytest.raises(JobCancelled):
+        run_document_job('identity_card', 'identity_card.png', user_id='user', cancel_token=threading.Event())
+    assert RecordingFirestoreWriter.writes == []
+    assert model.holder_records.pending_documents(model.holder_key_for('S1234567D')) == sorted(REQUIRED_DOCUMENTS)
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from models.validation import (
+    correct_nric, correct_plate, cross_check, is_valid_nric, is_valid_plate, nric_check_letter, plate_check_letter,
+)
+
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def test_checksums():
+    assert is_valid_nric('S1234567D')
+    assert not is_valid_nric('S1234567A')
+    assert is_valid_plate('SBS3229P')
+    assert is_valid_plate('SBS 3229 P')
+    assert not is_valid_plate('SBS3229A')
+
+
+@pytest.mark.parametrize('read, expected', [
+    ('S12345G7D', 'S1234567D'),  # Letter in a digit position
+    ('5I234567D', 'S1234567D'),  # Digits in letter and digit positions
+    ('S12345670', 'S1234567D'),  # Check letter read as a digit
+    ('S1234867D', 'S1234867D'),  # Wrong digit: left for a heavier OCR stage
+    ('S1234567A', 'S1234567A'),  # Wrong check letter: likewise
+])
+def test_correct_nric(read, expected):
+    assert correct_nric(read) == expected
+
+
+@pytest.mark.parametrize('read, expected', [
+    ('5BS3229P', 'SBS3229P'),  # Prefix letter read as a digit
+    ('S8S3229P', 'SBS3229P'),
+    ('SBS322GP', 'SBS322GP'),  # 'G' for '9' isn't a known lookalike: unchanged
+    ('SBS32290', 'SBS32290'),  # '0' doesn't look like the expected 'P': unchanged
+    ('SBS10078', 'SBS1007B'),  # Check letter read as a digit
+    ('SBS3228P', 'SBS3228P'),
+    ('E12A', 'E12A'),
+])
+def test_correct_plate(read, expected):
+    assert correct_plate(read) == expected
+
+
+def test_wrong_check_letter_is_never_repaired_into_another_number():
+    rng = random.Random(0)
+    for _ in range(5000):
+        prefix, digits = rng.choice('STFG'), ''.join(rng.choice('0123456789') for _ in range(7))
+        number = prefix + digits + nric_check_letter(prefix, digits)
+        misread = number[:-1] + rng.choice(LETTERS.replace(number[-1], ''))
+        assert correct_nric(misread) in (misread, number)
+
+        letters = ''.join(rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ') for _ in range(rng.randint(1, 3)))
+        digits = str(rng.randint(1, 9999))
+        plate = letters + digits + plate_check_letter(letters, digits)
+        misread = plate[:-1] + rng.choice(LETTERS.replace(plate[-1], ''))
+        assert correct_plate(misread) in (misread, plate)
+
+
+def test_cross_check_settles_invalid_number_from_valid_one():
+    corrections, issues = cross_check({'Identity_Card_No': 'S1234867D', 'License_Number': 'S1234567D'})
+    assert corrections == {'Identity_Card_No': 'S1234567D'}
+    assert not issues
+
+
+def test_cross_check_reports_disagreements():
+    corrections, issues = cross_check({
+        'Identity_Card_No': 'S1234867D', 'License_Number': 'S1234867D',
+        'Date_of_birth': '01-01-1990', 'Birth_Date': '02 Jan 1990',
+        'Name': 'TAN AH KOW', 'License_Name': 'LIM BENG',
+    })
+    assert not corrections
+    assert len(issues) == 3
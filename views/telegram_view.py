@@ -1,8 +1,6 @@
 import logging
 from telegram import ReplyKeyboardMarkup, KeyboardButton
-from models.model import process_uploaded_document, fetch_sanitized_name_from_firestore
-from firebase_admin import firestore
-from database.firebase_init import initialize_firestore
+from models.model import process_uploaded_document, fetch_holder_from_firestore
 import io
 
 logger = logging.getLogger(__name__)
@@ -14,7 +12,7 @@ def create_upload_button(button_text):
 
 # Start command handler
 def handle_start(update, context):
-    welcome_message = "Hello! Welcome to GoBingo Life. Please upload Policy holder's Identity Card as an image (JPEG or PNG format)."
+    welcome_message = "Hello! Welcome to GoBingo Life. Please upload Policy holder's Identity Card as an image (JPEG, PNG or TIFF) or a PDF."
     reply_markup = create_upload_button("Upload Policy holder's Identity Card")
     update.message.reply_text(welcome_message, reply_markup=reply_markup)
 
@@ -53,26 +51,28 @@ def handle_image_upload(update, context):
         # Determine which document type is being uploaded
         document_type = context.user_data.get('document_type', 'identity_card')
         
-        # Retrieve the sanitized_name if already stored in user data (after identity card processing)
-        sanitized_name = context.user_data.get('sanitized_name', None)
+        # Retrieve the holder_key if already stored in user data (after identity card processing)
+        holder_key = context.user_data.get('holder_key', None)
 
-        # If sanitized_name is missing for non-identity card uploads, fetch it from Firestore
-        if document_type != 'identity_card' and not sanitized_name:
+        # If holder_key is missing for non-identity card uploads, fetch it from Firestore
+        if document_type != 'identity_card' and not holder_key:
             user_id = str(update.message.from_user.id)
-            logger.info(f"Fetching sanitized_name from Firestore for user_id: {user_id}")
-            sanitized_name = fetch_sanitized_name_from_firestore(user_id)
-            if not sanitized_name:
+            logger.info(f"Fetching holder_key from Firestore for user_id: {user_id}")
+            holder_key, _ = fetch_holder_from_firestore(user_id)
+            if not holder_key:
                 update.message.reply_text("Missing identity card data. Please upload the Identity Card first.")
                 return
 
-        # Process the uploaded document with the sanitized_name if available
-        extracted_data = process_uploaded_document(file_like_object, document_type=document_type, sanitized_name=sanitized_name)
+        # Process the uploaded document with the holder_key if available
+        extracted_data = process_uploaded_document(file_like_object, document_type=document_type, user_id=str(update.message.from_user.id), holder_key=holder_key)
 
         if extracted_data:
             update.message.reply_text(f"Extracted Data: {extracted_data}")
             logger.info(f"Extracted data: {extracted_data}")
 
             # Initialize Firestore and save the extracted data
+            from firebase_admin import firestore
+            from database.firebase_init import initialize_firestore
             db = initialize_firestore()
             collection_name = 'identity_cards' if document_type == 'identity_card' else 'drivers_licenses' if document_type == 'drivers_license' else 'log_cards'
             doc_ref = db.collection(collection_name).document()  # Auto-generate document ID
@@ -82,8 +82,9 @@ def handle_image_upload(update, context):
                 'user_id': update.message.from_user.id
             })
 
-            # Store the sanitized_name in user_data after processing the identity card
+            # Store the holder_key in user_data after processing the identity card
             if document_type == 'identity_card':
+                context.user_data['holder_key'] = extracted_data.get('holder_key')
                 context.user_data['sanitized_name'] = extracted_data.get('sanitized_name')
                 reply_markup = create_upload_button("Upload Policy holder's Driver's License")
                 update.message.reply_text("Identity Card uploaded successfully. Now please upload the Driver's License.", reply_markup=reply_markup)